@@ -1,11 +1,115 @@
 #!/usr/bin/env python3
 import asyncio
+import atexit
 import functools
+import logging
+import os
+import threading
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable, Coroutine, Iterable
+from typing import Any
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Seconds given to the stop callbacks and to the loop thread to finish
+STOP_TIMEOUT = 5
+
+
+class LoopThread:
+    """
+    An event loop running forever in a daemon thread, shared by all synchronous facades of the process.
+
+    Keeping a single loop alive lets loop-bound resources (aiohttp sessions, pooled S3 clients)
+    be reused across synchronous calls instead of being rebuilt by `asyncio.run` every time.
+    The loop is recreated in forked children, where the parent's thread does not exist.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._on_stop: list[Callable[[], Awaitable[Any]]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="ant31box-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run[T](self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Run a coroutine on the background loop and block until it returns.
+
+        It can be called from inside a running event loop: that loop is blocked while waiting.
+        """
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("Cannot block on the background loop from within itself")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def on_stop(self, callback: Callable[[], Awaitable[Any]]) -> None:
+        """Run `callback` on the loop before it stops, e.g. to close the resources opened on it."""
+        self._on_stop.append(callback)
+
+    async def _run_on_stop(self) -> None:
+        for callback in self._on_stop:
+            try:
+                await callback()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("background loop stop callback failed: %s", e)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or self._loop.is_closed():
+                return
+            if self._on_stop:
+                try:
+                    asyncio.run_coroutine_threadsafe(self._run_on_stop(), self._loop).result(timeout=STOP_TIMEOUT)
+                except TimeoutError:
+                    logger.warning("background loop stop callbacks did not finish in %ss", STOP_TIMEOUT)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self._thread is not None:
+                self._thread.join(timeout=STOP_TIMEOUT)
+            self._loop = None
+            self._thread = None
+
+
+_loop_thread = LoopThread()
+atexit.register(_loop_thread.stop)
+
+
+def run_sync[T](coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion on the process-wide background loop."""
+    return _loop_thread.run(coro)
+
+
+def on_loop_stop(callback: Callable[[], Awaitable[Any]]) -> None:
+    """Register a coroutine function run on the background loop before it stops, at exit."""
+    _loop_thread.on_stop(callback)
+
+
+async def aiterate[T](items: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    """Iterate over a sync or async iterable alike."""
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
 
 
 def make_sync(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        return asyncio.run(func(*args, **kwargs))
+        return run_sync(func(*args, **kwargs))
 
     return wrapper
@@ -1,24 +1,127 @@
-import hashlib
+import asyncio
+import inspect
 import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from contextlib import ExitStack, asynccontextmanager
 from email.message import EmailMessage
-from io import IOBase
+from http import HTTPStatus
+from io import BufferedIOBase, BytesIO, IOBase
 from pathlib import Path
-from typing import Literal
+from tempfile import TemporaryFile
+from typing import IO, Any, Literal
 from urllib.parse import unquote, urlparse
 
 import aiofiles
-import aioshutil as shutil
+import aiohttp
+from aiohttp import compression_utils as aiohttp_compression
 from pydantic import BaseModel, ConfigDict, Field
 
+from ant31box.asyncutils import aiterate
 from ant31box.client.base import BaseClient
-from ant31box.config import S3ConfigSchema
-from ant31box.s3 import S3URL, S3Client
+from ant31box.codec import Encoding, decompress_stream, encoding_of
+from ant31box.config import DownloadConfigSchema, S3ConfigSchema, S3TransferConfigSchema
+from ant31box.digest import ContentDigest
+from ant31box.diskcache import CacheEntry, DiskCache
+from ant31box.localcopy import copy_file, copy_to_fileobj
+from ant31box.models import TransferResult
+from ant31box.s3 import S3URL, SHA256_METADATA, S3Client
+from ant31box.s3batch import ProgressCallback, TransferMeter
 
 # create a temporary directory using the context manager
 
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# download_many pulls at most this many items per concurrency slot ahead of the running downloads
+BATCH_BACKLOG_FACTOR = 8
+
+# Whether aiohttp decodes zstd bodies itself (3.13+ with a zstd module), it only handles gzip and deflate before
+AIOHTTP_ZSTD: bool = getattr(aiohttp_compression, "HAS_ZSTD", False)
+
+RESUME_STATUSES = {HTTPStatus.PARTIAL_CONTENT, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE}
+
+
+class SpooledBuffer(BufferedIOBase):
+    """
+    Binary file held in a BytesIO up to `max_size` bytes and moved to a temporary file beyond, like
+    SpooledTemporaryFile but with its in-memory state public: `rolled` and `getbuffer()`.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        self.rolled = False
+        self._memory: BytesIO | None = BytesIO()
+        self._file: IO[bytes] = self._memory
+
+    def rollover(self) -> None:
+        """Move the content to a temporary file, removed on close."""
+        if self._memory is None:
+            return
+        disk = TemporaryFile()  # noqa: SIM115 - owned by the buffer, closed by close()
+        disk.write(self._memory.getbuffer())
+        disk.seek(self._memory.tell())
+        self._memory.close()
+        self._memory = None
+        self._file = disk
+        self.rolled = True
+
+    def getbuffer(self) -> memoryview | None:
+        """Zero-copy view of the content while it is in memory, None once rolled over."""
+        return None if self._memory is None else self._memory.getbuffer()
+
+    def write(self, data: Any, /) -> int:
+        written = self._file.write(data)
+        if self._memory is not None and self._memory.tell() > self.max_size:
+            self.rollover()
+        return written
+
+    def read(self, size: int | None = -1, /) -> bytes:
+        return self._file.read(-1 if size is None else size)
+
+    def read1(self, size: int = -1, /) -> bytes:
+        return self.read(size)
+
+    def readinto(self, buffer: Any, /) -> int:
+        data = self._file.read(memoryview(buffer).nbytes)
+        memoryview(buffer).cast("B")[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def truncate(self, size: int | None = None, /) -> int:
+        return self._file.truncate(size)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def fileno(self) -> int:
+        self.rollover()
+        return self._file.fileno()
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
 
 class FileInfo(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -28,10 +131,107 @@ class FileInfo(BaseModel):
     source: str | Path | None = Field(default=None)
     metadata: dict[str, str] | None = Field(default=None)
 
+    def getbuffer(self) -> memoryview | None:
+        """
+        Zero-copy view of the content when it is held in memory: a BytesIO, or a spooled file that did not
+        spill to disk. None otherwise.
+
+        The content cannot be resized while the view is alive, release it when done.
+        """
+        content = self.content
+        if isinstance(content, BytesIO | SpooledBuffer):
+            return content.getbuffer()
+        return None
+
+
+def _cache_control(value: str) -> dict[str, str]:
+    directives: dict[str, str] = {}
+    for directive in value.split(","):
+        name, _, arg = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+def _expires(resp: aiohttp.ClientResponse) -> float:
+    """Timestamp until which a response is fresh according to Cache-Control max-age, 0 if it is not."""
+    directives = _cache_control(resp.headers.get("Cache-Control", ""))
+    if "no-cache" in directives or not directives.get("max-age", "").isdigit():
+        return 0.0
+    age = resp.headers.get("Age", "0")
+    max_age = int(directives["max-age"]) - (int(age) if age.isdigit() else 0)
+    return time.time() + max_age if max_age > 0 else 0.0
+
+
+class PartialState(BaseModel):
+    source: str = Field(..., description="Source of the partial download.")
+    validator: str = Field(..., description="ETag or Last-Modified of the source when the download started.")
+
+
+class PartialDownload:
+    """
+    A download written to `<base>.part`, resumable as long as the source validator is unchanged.
+
+    The validator (ETag or Last-Modified) is saved in a `<base>.part.json` sidecar before any byte is
+    written, so an interrupted download can be continued with a Range request on retry.
+    """
+
+    def __init__(self, base: str | Path, source: str):
+        base = Path(base)
+        self.source = source
+        self.part = base.with_name(f"{base.name}.part")
+        self.sidecar = base.with_name(f"{base.name}.part.json")
+
+    def resumable(self) -> tuple[str, int] | None:
+        """Validator and size of a previous partial download of the same source, if any."""
+        try:
+            state = PartialState.model_validate_json(self.sidecar.read_bytes())
+            size = self.part.stat().st_size
+        except (OSError, ValueError):
+            return None
+        if state.source != self.source or not size:
+            return None
+        return state.validator, size
+
+    async def write(self, chunks: AsyncIterator[bytes], validator: str, offset: int = 0) -> None:
+        """
+        Write `chunks` to the partial file from `offset`, the bytes before it being kept.
+
+        Without a validator the download cannot be resumed safely: nothing is kept on failure.
+        """
+        if validator:
+            self.sidecar.write_text(
+                PartialState(source=self.source, validator=validator).model_dump_json(), encoding="utf-8"
+            )
+        else:
+            self.sidecar.unlink(missing_ok=True)
+        try:
+            async with aiofiles.open(self.part, "r+b" if offset else "wb") as fopen:
+                await fopen.truncate(offset)
+                await fopen.seek(offset)
+                async for chunk in chunks:
+                    await fopen.write(chunk)
+        except BaseException:
+            if not validator:
+                self.discard()
+            raise
+
+    def complete(self, dest: str | Path) -> None:
+        os.replace(self.part, dest)
+        self.sidecar.unlink(missing_ok=True)
+
+    def discard(self) -> None:
+        self.part.unlink(missing_ok=True)
+        self.sidecar.unlink(missing_ok=True)
+
 
 class DownloadClient(BaseClient):
-    def __init__(self, s3_config: S3ConfigSchema | None = None) -> None:
+    def __init__(self, s3_config: S3ConfigSchema | None = None, config: DownloadConfigSchema | None = None) -> None:
         super().__init__(endpoint="", client_name="filedl")
+        self.config = config or DownloadConfigSchema()
+        self.cache: DiskCache | None = DiskCache(self.config.cache) if self.config.cache.enabled else None
+        # In-flight coalesced downloads by normalized source
+        self._flights: dict[str, asyncio.Future[FileInfo]] = {}
         self.s3 = None
         if s3_config is not None:
             self.set_s3(s3_config)
@@ -39,31 +239,118 @@ class DownloadClient(BaseClient):
     def set_s3(self, s3_config: S3ConfigSchema) -> None:
         self.s3 = S3Client(s3_config)
 
-    def _gen_sha(self, content: bytes, source_path: str, dest_dir: str, filename: str) -> str:
-        path = Path(source_path)
-        hashsha = hashlib.sha256(content)
-        suffix = path.suffix
-        filename = hashsha.hexdigest() + suffix
-        return str(Path(dest_dir).joinpath(filename))
+    @staticmethod
+    def _content_path(sha256: str, filename: str, dest_dir: str | Path) -> Path:
+        return Path(dest_dir).joinpath(sha256 + Path(filename).suffix)
+
+    @asynccontextmanager
+    async def open_stream(self, source: str) -> AsyncIterator[tuple[str, AsyncIterator[bytes]]]:
+        """
+        Open a file, http(s) or s3 source as a stream of `chunk_size` chunks.
+
+        Yields:
+            The source filename and an async iterator over its content. The underlying file or
+            response is released when the context exits.
+        """
+        parsedurl = urlparse(source)
+        if parsedurl.scheme in ["file", ""]:
+            async with aiofiles.open(parsedurl.path, "rb") as fopen:
+
+                async def read() -> AsyncIterator[bytes]:
+                    while chunk := await fopen.read(self.config.chunk_size):
+                        yield chunk
+
+                yield Path(parsedurl.path).name, read()
+        elif parsedurl.scheme in ["http", "https"]:
+            async with self.session.get(source, headers=self.headers()) as resp:
+                resp.raise_for_status()
+                yield self._filename(resp, parsedurl.path), self._body(resp)
+        elif parsedurl.scheme in ["s3"]:
+            if self.s3 is None:
+                raise AttributeError("S3 client is not set")
+            s3url = S3URL(url=source)
+            chunks = self.s3.stream_object(s3url.to_model(), self.config.chunk_size, decode=self.config.decode_content)
+            try:
+                yield s3url.filename, chunks
+            finally:
+                await chunks.aclose()
+        else:
+            raise AttributeError(f"Unsupported file source: scheme={parsedurl.scheme} - path={parsedurl.path}")
+
+    async def download_content_addressed(
+        self, source: str, dest_dir: str | Path = "", algorithms: Iterable[str] | None = None
+    ) -> FileInfo:
+        """
+        Download a source of any scheme to `<sha256><suffix>` in `dest_dir`.
+
+        The digests are computed incrementally while the content streams to a temporary file, which is
+        dropped if a file with the same digest is already stored. S3 objects uploaded with their sha256
+        in metadata (see `S3Client.upload_file_async(skip_unchanged=True)`) are not transferred at all
+        when already stored.
+
+        Args:
+            source: file, http(s) or s3 source.
+            dest_dir: Content-addressed store directory.
+            algorithms: hashlib algorithms computed besides sha256, defaults to `DownloadConfigSchema.digests`.
+
+        Returns:
+            A FileInfo whose metadata holds the hex digest of every algorithm and the size.
+        """
+        names = ["sha256", *(name for name in algorithms or self.config.digests if name != "sha256")]
+        if urlparse(source).scheme == "s3" and self.s3 is not None:
+            s3url = S3URL(url=source)
+            client = await self.s3.client()
+            head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key)
+            sha256 = head.get("Metadata", {}).get(SHA256_METADATA, "")
+            path = self._content_path(sha256, s3url.filename, dest_dir)
+            if sha256 and names == ["sha256"] and path.exists():
+                logger.info("content already stored source='%s' path='%s'", source, path)
+                metadata = {"sha256": sha256, "size": str(path.stat().st_size)}
+                return FileInfo(filename=s3url.filename, path=path, source=source, metadata=metadata)
+
+        digest = ContentDigest(names)
+        tmp = Path(dest_dir).joinpath(f".tmp-{uuid.uuid4().hex}")
+        try:
+            async with self.open_stream(source) as (filename, chunks), aiofiles.open(tmp, "wb") as fopen:
+                async for chunk in chunks:
+                    # Hashing runs in a thread: hashlib releases the GIL on large buffers
+                    await asyncio.to_thread(digest.update, chunk)
+                    await fopen.write(chunk)
+            path = self._content_path(digest.hexdigest(), filename, dest_dir)
+            if path.exists():
+                logger.info("content already stored source='%s' path='%s'", source, path)
+                tmp.unlink()
+            else:
+                os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        metadata = {**digest.hexdigests(), "size": str(digest.size)}
+        return FileInfo(filename=filename, path=path, source=source, metadata=metadata)
 
     async def copy_local_file(
         self, source_path: str, dest_dir: str | Path = "", output: str | Path | IOBase = ""
     ) -> FileInfo:
+        """
+        Copy a local file without loading it in memory.
+
+        Paths are copied in the kernel (copy_file_range, sendfile), or hardlinked/reflinked according to
+        `DownloadConfigSchema.local_copy`. File objects are written from a memory map in `chunk_size` chunks.
+        """
         filename = Path(source_path).name
         # Write output
         # if output is a IOBase, write the content to it and return it
         if output and isinstance(output, IOBase):
-            # Read input
-            async with aiofiles.open(source_path, "rb") as fopen:
-                output.write(await fopen.read())
-                return FileInfo(content=output, filename=filename, source=source_path)
+            await asyncio.to_thread(copy_to_fileobj, source_path, output, self.config.chunk_size)
+            return FileInfo(content=output, filename=filename, source=source_path)
 
         # if output is a string, write the content to that file and return
-        elif output and isinstance(output, Path | str):
+        if output and isinstance(output, Path | str):
             dest_path = output
         else:
             dest_path = Path(dest_dir).joinpath(filename)
-        await shutil.copyfile(source_path, dest_path)
+        technique = await asyncio.to_thread(copy_file, source_path, dest_path, self.config.local_copy)
+        logger.debug("copied source='%s' dest='%s' with %s", source_path, dest_path, technique)
         return FileInfo(filename=filename, path=dest_path, source=source_path)
 
     def headers(
@@ -76,14 +363,9 @@ class DownloadClient(BaseClient):
             headers.update(extra)
         return super().headers(content_type=content_type, extra=headers)
 
-    async def download_file(
-        self, url: str, source_path: str, dest_dir: str | Path = "", output: str | Path | IOBase = ""
-    ) -> FileInfo:
-        resp = await self.session.get(url, headers=self.headers())
-        resp.raise_for_status()
-
+    @staticmethod
+    def _filename(resp: aiohttp.ClientResponse, source_path: str) -> str:
         filename: str = ""
-
         content_disposition = resp.headers.get("Content-Disposition")
         if content_disposition:
             msg = EmailMessage()
@@ -92,21 +374,266 @@ class DownloadClient(BaseClient):
             filename = params.get("filename", "")
         if not filename:
             filename = unquote(Path(source_path).name)
+        return filename
+
+    async def download_file(
+        self, url: str, source_path: str, dest_dir: str | Path = "", output: str | Path | IOBase = ""
+    ) -> FileInfo:
+        """
+        Download a URL, streaming the body to the output in `chunk_size` chunks.
 
-        content = await resp.content.read()
+        Memory stays bounded by the chunk size whatever the body size. The response is released
+        on error, and a partially written destination file is removed.
+
+        With `connections` above 1, downloads to a file first request `part_size` bytes. When the server
+        answers with a partial response, the remaining ranges are fetched on that many connections and
+        written at their offset in a preallocated file. Otherwise the full body is streamed as usual.
+        """
+        if self.cache is not None:
+            return await self._download_cached(url, source_path, dest_dir, output)
+        if self.config.resume and not isinstance(output, IOBase):
+            return await self._download_resumable(url, source_path, dest_dir, output)
+        headers = self.headers()
+        ranged = self.config.connections > 1 and not isinstance(output, IOBase)
+        if ranged:
+            headers.update({"Range": f"bytes=0-{self.config.part_size - 1}", "Accept-Encoding": "identity"})
+        async with self.session.get(url, headers=headers) as resp:
+            resp.raise_for_status()
+            return await self._write_response(url, resp, self._filename(resp, source_path), dest_dir, output)
 
+    def _body(self, resp: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """
+        The response body in `chunk_size` chunks, decompressed with `decode_content` when aiohttp left it encoded:
+        when the session does not decompress automatically, or for zstd with aiohttp releases not decoding it.
+        """
+        chunks = resp.content.iter_chunked(self.config.chunk_size)
+        encoding = encoding_of(resp.headers.get("Content-Encoding"))
+        if not self.config.decode_content or encoding is None:
+            return chunks
+        # aiohttp keeps the Content-Encoding header of the bodies it decodes
+        if not self.session.auto_decompress or (encoding == "zstd" and not AIOHTTP_ZSTD):
+            return decompress_stream(chunks, encoding)
+        return chunks
+
+    async def _write_response(
+        self,
+        url: str,
+        resp: aiohttp.ClientResponse,
+        filename: str,
+        dest_dir: str | Path = "",
+        output: str | Path | IOBase = "",
+    ) -> FileInfo:
         if output and isinstance(output, IOBase):
-            output.write(content)
-            fd = FileInfo(content=output, filename=filename, source=url)
-            return fd
+            async for chunk in self._body(resp):
+                output.write(chunk)
+            return FileInfo(content=output, filename=filename, source=url)
         if output and isinstance(output, Path | str):
             dest_path = output
         else:
             dest_path = Path(dest_dir).joinpath(filename)
-        async with aiofiles.open(dest_path, "wb") as fopen:
-            await fopen.write(content)
-        fd = FileInfo(filename=filename, path=dest_path, source=url)
-        return fd
+        try:
+            if resp.status == HTTPStatus.PARTIAL_CONTENT:
+                await self._download_ranges(url, resp, dest_path)
+            else:
+                async with aiofiles.open(dest_path, "wb") as fopen:
+                    async for chunk in self._body(resp):
+                        await fopen.write(chunk)
+        except BaseException:
+            Path(dest_path).unlink(missing_ok=True)
+            raise
+        return FileInfo(filename=filename, path=dest_path, source=url)
+
+    async def _download_cached(
+        self, url: str, source_path: str, dest_dir: str | Path = "", output: str | Path | IOBase = ""
+    ) -> FileInfo:
+        """
+        Serve a URL through the HTTP cache.
+
+        Entries within their Cache-Control max-age are served without any request. Stale entries are
+        revalidated with If-None-Match / If-Modified-Since and served from the cache on 304.
+        """
+        assert self.cache is not None
+        headers = self.headers()
+        # Stale entries are only hits once revalidated
+        entry = self.cache.peek(url)
+        if entry is not None:
+            if float(entry.metadata.get("expires", "0")) > time.time():
+                logger.info("http cache fresh url='%s'", url)
+                self.cache.record(hit=True)
+                return await self._from_cache(entry, url, dest_dir, output)
+            if etag := entry.metadata.get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := entry.metadata.get("last_modified"):
+                headers["If-Modified-Since"] = last_modified
+
+        async with self.session.get(url, headers=headers) as resp:
+            if entry is not None and resp.status == HTTPStatus.NOT_MODIFIED:
+                logger.info("http cache revalidated url='%s'", url)
+                metadata = {**entry.metadata, "expires": str(_expires(resp))}
+                entry = self.cache.update(url, metadata) or entry
+                self.cache.record(hit=True)
+                return await self._from_cache(entry, url, dest_dir, output)
+            resp.raise_for_status()
+            self.cache.record(hit=False)
+            filename = self._filename(resp, source_path)
+            metadata = self._cache_metadata(resp, filename)
+            if metadata is None or (resp.content_length or 0) > self.cache.max_bytes:
+                return await self._write_response(url, resp, filename, dest_dir, output)
+            tmp = self.cache.tempfile()
+            try:
+                async with aiofiles.open(tmp, "wb") as fopen:
+                    async for chunk in self._body(resp):
+                        await fopen.write(chunk)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+        entry = self.cache.commit(url, tmp, metadata)
+        return await self._from_cache(entry, url, dest_dir, output)
+
+    @staticmethod
+    def _cache_metadata(resp: aiohttp.ClientResponse, filename: str) -> dict[str, str] | None:
+        """Validators and freshness of a response, None if it must not be cached."""
+        directives = _cache_control(resp.headers.get("Cache-Control", ""))
+        if "no-store" in directives:
+            return None
+        etag = resp.headers.get("ETag", "")
+        last_modified = resp.headers.get("Last-Modified", "")
+        expires = _expires(resp)
+        if not etag and not last_modified and not expires:
+            return None
+        return {"etag": etag, "last_modified": last_modified, "expires": str(expires), "filename": filename}
+
+    async def _from_cache(
+        self, entry: CacheEntry, url: str, dest_dir: str | Path = "", output: str | Path | IOBase = ""
+    ) -> FileInfo:
+        assert self.cache is not None
+        filename = entry.metadata.get("filename", "")
+        if output and isinstance(output, IOBase):
+            await self.cache.materialize(entry, output)
+            return FileInfo(content=output, filename=filename, source=url)
+        dest_path = output or Path(dest_dir).joinpath(filename)
+        await self.cache.materialize(entry, dest_path)
+        return FileInfo(filename=filename, path=dest_path, source=url)
+
+    @staticmethod
+    def _validator(resp: aiohttp.ClientResponse) -> str:
+        """Strong ETag, or Last-Modified, usable in an If-Range header."""
+        etag = resp.headers.get("ETag", "")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return resp.headers.get("Last-Modified", "")
+
+    async def _download_resumable(
+        self, url: str, source_path: str, dest_dir: str | Path, output: str | Path
+    ) -> FileInfo:
+        """
+        Download to `<dest>.part`, continuing a previous partial download with a Range request.
+
+        If-Range makes the server send the full body instead of the range when the validator changed,
+        in which case the download starts over.
+        """
+        # The final name may come from Content-Disposition: the partial file uses the name known upfront
+        base = Path(output) if output else Path(dest_dir).joinpath(unquote(Path(source_path).name))
+        partial = PartialDownload(base, url)
+        previous = partial.resumable()
+        validator, offset = previous or ("", 0)
+        headers = self.headers()
+        if previous is not None:
+            headers.update({"Range": f"bytes={offset}-", "If-Range": validator, "Accept-Encoding": "identity"})
+        async with self.session.get(url, headers=headers) as resp:
+            resumed = previous is not None and resp.status in RESUME_STATUSES
+            if resumed and not self._continues(resp, validator, offset):
+                # Some servers ignore If-Range with ETags: a range of another version is not used
+                partial.discard()
+                resp.release()
+                logger.info("source changed, restarting download url='%s'", url)
+                return await self._download_resumable(url, source_path, dest_dir, output)
+            if not resumed:
+                resp.raise_for_status()
+            filename = self._filename(resp, source_path)
+            chunks = resp.content.iter_chunked(self.config.chunk_size)
+            if not resumed:
+                if previous is not None:
+                    logger.info("source changed, restarting download url='%s'", url)
+                await partial.write(chunks, self._validator(resp))
+            elif resp.status == HTTPStatus.PARTIAL_CONTENT:
+                logger.info("resuming download url='%s' offset=%d", url, offset)
+                await partial.write(chunks, validator, offset)
+            # A 416 means the previous attempt stopped right before completing: nothing is left to fetch
+        dest_path = output or Path(dest_dir).joinpath(filename)
+        partial.complete(dest_path)
+        return FileInfo(filename=filename, path=dest_path, source=url)
+
+    def _continues(self, resp: aiohttp.ClientResponse, validator: str, offset: int) -> bool:
+        """Whether a range response continues a partial download of `offset` bytes with `validator`."""
+        content_range = resp.headers.get("Content-Range", "")
+        if resp.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            return content_range == f"bytes */{offset}"
+        return self._validator(resp) == validator and content_range.startswith(f"bytes {offset}-")
+
+    @staticmethod
+    def _range_total(resp: aiohttp.ClientResponse) -> int:
+        # Content-Range: bytes 0-8388607/123456789
+        content_range = resp.headers.get("Content-Range", "")
+        total = content_range.rpartition("/")[2]
+        if not total.isdigit():
+            raise aiohttp.ClientPayloadError(f"Unsupported Content-Range: '{content_range}'")
+        return int(total)
+
+    @staticmethod
+    def _preallocate(fd: int, size: int) -> None:
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass
+        os.ftruncate(fd, size)
+
+    async def _write_at(self, fd: int, resp: aiohttp.ClientResponse, offset: int) -> None:
+        async for chunk in resp.content.iter_chunked(self.config.chunk_size):
+            await asyncio.to_thread(os.pwrite, fd, chunk, offset)
+            offset += len(chunk)
+
+    async def _download_ranges(self, url: str, first: aiohttp.ClientResponse, dest_path: str | Path) -> None:
+        """Write the first partial response and fetch the remaining ranges concurrently."""
+        total = self._range_total(first)
+        part_size = self.config.part_size
+        # Every range must come from the same version of the resource as the first one
+        conditions: dict[str, str] = {"Accept-Encoding": "identity"}
+        etag = first.headers.get("ETag", "")
+        if etag and not etag.startswith("W/"):
+            conditions["If-Match"] = etag
+        elif last_modified := first.headers.get("Last-Modified"):
+            conditions["If-Unmodified-Since"] = last_modified
+        starts = iter(range(part_size, total, part_size))
+        logger.info("ranged download url='%s' size=%d connections=%d", url, total, self.config.connections)
+
+        async def fetch(start: int) -> None:
+            end = min(start + part_size, total) - 1
+            headers = self.headers(extra={"Range": f"bytes={start}-{end}", **conditions})
+            async with self.session.get(url, headers=headers) as resp:
+                resp.raise_for_status()
+                if resp.status != HTTPStatus.PARTIAL_CONTENT:
+                    raise aiohttp.ClientPayloadError(f"Range {start}-{end} of '{url}' was not honoured")
+                await self._write_at(fd, resp, start)
+
+        async def worker() -> None:
+            for start in starts:
+                await fetch(start)
+
+        fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            await asyncio.to_thread(self._preallocate, fd, total)
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self._write_at(fd, first, 0))
+                for _ in range(self.config.connections - 1):
+                    tg.create_task(worker())
+        except ExceptionGroup as eg:
+            # Fail with the error of the range, as a single-stream download would
+            raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+        finally:
+            os.close(fd)
 
     async def download_s3(self, source: str, dest_dir: str | Path = "", output: str | Path | IOBase = "") -> FileInfo:
         s3url = S3URL(url=source)
@@ -116,24 +643,56 @@ class DownloadClient(BaseClient):
         if not output:
             output = Path(dest_dir).joinpath(s3url.filename)
 
-        if hasattr(output, "write"):
+        if self.config.resume and isinstance(output, Path | str):
+            await self._download_s3_resumable(s3url, output)
+            fd.path = output
+        elif hasattr(output, "write"):
             # write to file-like object
-            await self.s3.download_file_async(s3url=s3url.to_model(), dest=output)
+            await self.s3.download_file_async(s3url=s3url.to_model(), dest=output, decode=self.config.decode_content)
             fd.content = output
         elif isinstance(output, Path | str):
-            # write to file on disk
-            async with aiofiles.open(str(output), "wb") as fileobj:
-                await self.s3.download_file_async(s3url=s3url.to_model(), dest=fileobj)
+            # write to file on disk, letting the S3 client serve it from its cache when enabled
+            await self.s3.download_file_async(
+                s3url=s3url.to_model(), dest=str(output), decode=self.config.decode_content
+            )
             fd.path = output
         return fd
 
+    async def _download_s3_resumable(self, s3url: S3URL, output: str | Path) -> None:
+        """S3 counterpart of `_download_resumable`, pinning the object version with IfMatch."""
+        assert self.s3 is not None
+        client = await self.s3.client()
+        head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key)
+        etag, size = head["ETag"], head["ContentLength"]
+        partial = PartialDownload(output, s3url.url)
+        previous = partial.resumable()
+        offset = 0
+        if previous is not None and previous[0] == etag and previous[1] <= size:
+            offset = previous[1]
+            logger.info("resuming download url='%s' offset=%d", s3url.url, offset)
+        elif previous is not None:
+            logger.info("source changed, restarting download url='%s'", s3url.url)
+        if offset < size:
+            chunks = self.s3.stream_object(
+                s3url.to_model(), self.config.chunk_size, offset=offset, extra_args={"IfMatch": etag}
+            )
+            await partial.write(chunks, etag, offset)
+        partial.complete(output)
+
     async def download(self, source: str, dest_dir: str | Path = "", output: str | Path | IOBase = "") -> FileInfo:
         """
         Determine the protocol to fetch the document:
         file://,
         http://,
         s3:// ...
+
+        With `DownloadConfigSchema.coalesce`, concurrent downloads of the same source share one transfer.
         """
+        if self.config.coalesce:
+            return await self._download_coalesced(source, dest_dir, output)
+        return await self._fetch(source, dest_dir, output)
+
+    async def _fetch(self, source: str, dest_dir: str | Path = "", output: str | Path | IOBase = "") -> FileInfo:
         parsedurl = urlparse(source)
         logger.info("download %s, %s", source, parsedurl.path)
         if parsedurl.scheme in ["file", ""]:
@@ -143,3 +702,193 @@ class DownloadClient(BaseClient):
         if parsedurl.scheme in ["s3"]:
             return await self.download_s3(source=source, dest_dir=dest_dir, output=output)
         raise AttributeError(f"Unsupported file source: scheme={parsedurl.scheme} - path={parsedurl.path}")
+
+    async def download_spooled(self, source: str, max_size: int | None = None) -> FileInfo:
+        """
+        Download a source into a SpooledBuffer exposed on `FileInfo.content`, rewound.
+
+        Content up to `max_size` bytes (default `DownloadConfigSchema.spool_max_size`) stays in memory and is
+        available without copy from `FileInfo.getbuffer()`. Larger content spills to a temporary file,
+        removed when the content is closed.
+        """
+        with ExitStack() as stack:
+            spool = stack.enter_context(
+                SpooledBuffer(max_size=self.config.spool_max_size if max_size is None else max_size)
+            )
+            info = await self.download(source, output=spool)
+            # Closed on error only, the caller owns it from here
+            stack.pop_all()
+        spool.seek(0)
+        return info
+
+    @staticmethod
+    def _flight_key(source: str) -> str:
+        """Normalize a source URL: lowercase scheme and host, no default port, no fragment."""
+        parsed = urlparse(source)
+        scheme = parsed.scheme.lower()
+        userinfo, _, _ = parsed.netloc.rpartition("@")
+        netloc = parsed.hostname or ""
+        if parsed.port is not None and (scheme, parsed.port) not in {("http", 80), ("https", 443)}:
+            netloc = f"{netloc}:{parsed.port}"
+        if userinfo:
+            netloc = f"{userinfo}@{netloc}"
+        return parsed._replace(scheme=scheme, netloc=netloc, fragment="").geturl()
+
+    def _land(self, key: str, flight: asyncio.Future[FileInfo]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            # retrieved here so that a flight whose callers were all cancelled does not log a lost exception
+            flight.exception()
+
+    async def _download_coalesced(self, source: str, dest_dir: str | Path, output: str | Path | IOBase) -> FileInfo:
+        """
+        Singleflight: the first caller of a source downloads it, callers arriving while it is in flight wait for
+        it and get their own copy of the result.
+
+        Local files and downloads into file objects never lead a flight, the latter can still join one.
+        """
+        key = self._flight_key(source)
+        flight = self._flights.get(key)
+        if flight is None:
+            if urlparse(source).scheme in ["file", ""] or isinstance(output, IOBase):
+                return await self._fetch(source, dest_dir, output)
+            flight = asyncio.ensure_future(self._fetch(source, dest_dir, output))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+            # shielded: a cancelled leader must not fail the callers waiting on its flight
+            return await asyncio.shield(flight)
+        logger.info("download %s joins an in-flight download", source)
+        leader = await asyncio.shield(flight)
+        return await self._copy_flight(leader, source, dest_dir, output)
+
+    async def _copy_flight(
+        self, leader: FileInfo, source: str, dest_dir: str | Path, output: str | Path | IOBase
+    ) -> FileInfo:
+        if leader.path is None:
+            raise ValueError(f"in-flight download of {source} has no file to copy")
+        metadata = dict(leader.metadata) if leader.metadata is not None else None
+        if isinstance(output, IOBase):
+            await asyncio.to_thread(copy_to_fileobj, leader.path, output, self.config.chunk_size)
+            return leader.model_copy(update={"content": output, "path": None, "source": source, "metadata": metadata})
+        dest_path = output or Path(dest_dir).joinpath(leader.filename)
+        if os.path.abspath(dest_path) != os.path.abspath(leader.path):
+            technique = await asyncio.to_thread(copy_file, leader.path, dest_path, self.config.local_copy)
+            logger.debug("copied in-flight download source='%s' dest='%s' with %s", source, dest_path, technique)
+        return leader.model_copy(update={"path": dest_path, "source": source, "metadata": metadata})
+
+    async def transfer(
+        self,
+        source: str,
+        s3_dest: str,
+        *,
+        transfer: S3TransferConfigSchema | None = None,
+        algorithms: Iterable[str] | None = None,
+        extra_args: dict[str, Any] | None = None,
+        encoding: Encoding | None = None,
+    ) -> FileInfo:
+        """
+        Stream a file, http(s) or s3 source straight into an S3 multipart upload, without local disk.
+
+        Buffering is bounded by the upload part size times its concurrency (see `S3Client.upload_stream_async`).
+
+        Args:
+            source: file, http(s) or s3 source.
+            s3_dest: Destination `s3://bucket/key` URL.
+            transfer: Upload transfer settings override.
+            algorithms: hashlib algorithms computed besides sha256, defaults to `DownloadConfigSchema.digests`.
+            extra_args: Extra upload arguments, e.g. ContentType.
+            encoding: Store the object compressed with gzip or zstd, see `S3Client.upload_stream_async`.
+
+        Returns:
+            A FileInfo whose metadata holds the destination, the size and the hex digest of every algorithm,
+            computed on the uncompressed content.
+        """
+        if self.s3 is None:
+            raise AttributeError("S3 client is not set")
+        dest = S3URL(url=s3_dest)
+        digest = ContentDigest(["sha256", *(name for name in algorithms or self.config.digests if name != "sha256")])
+
+        async def hashed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+            async for chunk in chunks:
+                await asyncio.to_thread(digest.update, chunk)
+                yield chunk
+
+        meter = TransferMeter("transfer")
+        async with self.open_stream(source) as (filename, chunks):
+            await self.s3.upload_stream_async(
+                hashed(chunks), dest.key, transfer, bucket=dest.bucket, extra_args=extra_args, encoding=encoding
+            )
+        meter(digest.size)
+        meter.log(dest.url)
+        metadata = {**dest.to_dict(), "size": str(digest.size), **digest.hexdigests()}
+        return FileInfo(filename=filename, source=source, metadata=metadata)
+
+    @staticmethod
+    def _origin(source: str) -> str:
+        """Key sources are rate limited by: the host for http(s), the bucket for s3."""
+        parsedurl = urlparse(source)
+        if parsedurl.scheme in ["http", "https", "s3"]:
+            return f"{parsedurl.scheme}://{parsedurl.netloc}"
+        return "file"
+
+    async def download_many(
+        self,
+        items: Iterable[str | tuple[str, str | Path | IOBase]] | AsyncIterable[str | tuple[str, str | Path | IOBase]],
+        dest_dir: str | Path = "",
+        *,
+        concurrency: int | None = None,
+        per_host: int | None = None,
+        progress: ProgressCallback | None = None,
+    ) -> list[TransferResult]:
+        """
+        Download many sources of any scheme concurrently.
+
+        Args:
+            items: Sources, or (source, output) pairs, consumed lazily.
+            dest_dir: Directory of the sources given without an output.
+            concurrency: Maximum downloads in flight, defaults to `DownloadConfigSchema.concurrency`.
+            per_host: Maximum downloads in flight per http(s) host, s3 bucket or for local files,
+                defaults to `DownloadConfigSchema.per_host_concurrency`.
+            progress: Called with each TransferResult as it completes, may be a coroutine function.
+
+        Returns:
+            One TransferResult per item in input order, holding the FileInfo or the error.
+        """
+        concurrency = max(1, concurrency or self.config.concurrency)
+        per_host = max(1, per_host or self.config.per_host_concurrency)
+        slots = asyncio.Semaphore(concurrency)
+        # Items waiting for a busy origin must not hold a global slot: only a window of them is pulled
+        backlog = asyncio.Semaphore(concurrency * BATCH_BACKLOG_FACTOR)
+        origins: defaultdict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_host))
+        results: dict[int, TransferResult] = {}
+
+        async def run(index: int, source: str, output: str | Path | IOBase) -> None:
+            try:
+                async with origins[self._origin(source)], slots:
+                    try:
+                        info = await self.download(source, dest_dir=dest_dir, output=output)
+                        res = TransferResult(source=source, dest=output or dest_dir, result=info)
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        logger.warning("download failed source='%s': %s", source, e)
+                        res = TransferResult(source=source, dest=output or dest_dir, error=e)
+                results[index] = res
+                if progress is not None:
+                    ret = progress(res)
+                    if inspect.isawaitable(ret):
+                        await ret
+            finally:
+                backlog.release()
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                index = 0
+                async for item in aiterate(items):
+                    source, output = (item, "") if isinstance(item, str) else item
+                    await backlog.acquire()
+                    tg.create_task(run(index, source, output))
+                    index += 1
+        except ExceptionGroup as eg:
+            # The items or the progress callback failed: their error, not a group
+            raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+        return [results[i] for i in range(len(results))]
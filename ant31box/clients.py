@@ -2,7 +2,7 @@ import warnings
 from functools import cache
 
 from ant31box.client.filedl import DownloadClient
-from ant31box.config import Config, S3ConfigSchema, config
+from ant31box.config import Config, DownloadConfigSchema, S3ConfigSchema, config
 
 
 @cache
@@ -22,11 +22,14 @@ def filedl_client(key: str = "", conf: Config | None = None) -> DownloadClient:
         warnings.warn("The 'key' parameter is deprecated and has no effect.", DeprecationWarning, stacklevel=2)
 
     s3_conf: S3ConfigSchema | None = None
+    download_conf: DownloadConfigSchema | None = None
     if conf is None:
         # Backward compatibility: use the global config if no specific config is provided.
         # This is deprecated.
         conf = config()
     if hasattr(conf.conf, "s3"):
         s3_conf = conf.conf.s3
+    if hasattr(conf.conf, "download"):
+        download_conf = conf.conf.download
 
-    return DownloadClient(s3_config=s3_conf)
+    return DownloadClient(s3_config=s3_conf, config=download_conf)
@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from typing import Any, Literal, Protocol
+
+from ant31box.asyncutils import aiterate
+
+type Encoding = Literal["gzip", "zstd"]
+
+ENCODINGS: tuple[Encoding, ...] = ("gzip", "zstd")
+# Content-Encoding aliases of the supported codecs
+_ALIASES: dict[str, Encoding] = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd"}
+# zlib window bits: 16 + MAX_WBITS writes a gzip header, 32 + MAX_WBITS also reads zlib streams
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+AUTO_WBITS = 32 + zlib.MAX_WBITS
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes, /) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+def _zstandard() -> Any:
+    """The zstandard module, an optional dependency imported on first use of the zstd codec."""
+    try:
+        return importlib.import_module("zstandard")
+    except ImportError as e:
+        raise ImportError("The 'zstandard' package is required for zstd encoding, install ant31box[zstd].") from e
+
+
+def encoding_of(content_encoding: str | None) -> Encoding | None:
+    """The codec of a Content-Encoding value, None when it is empty, identity or unsupported."""
+    if not content_encoding:
+        return None
+    # Stacked encodings are listed in the order applied, the last one is undone first
+    return _ALIASES.get(content_encoding.rpartition(",")[2].strip().lower())
+
+
+def compressor(encoding: Encoding, level: int | None = None) -> Compressor:
+    """A streaming compressor, `level` defaults to 6 for gzip and 3 for zstd."""
+    if encoding == "gzip":
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, GZIP_WBITS)
+    if encoding == "zstd":
+        return _zstandard().ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class Decompressor:
+    """Streaming decompressor, reading concatenated gzip members and zstd frames."""
+
+    def __init__(self, encoding: Encoding):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self._obj = self._new()
+        # Whether the current member/frame was started and not completed yet
+        self.pending = False
+
+    def _new(self):
+        if self.encoding == "gzip":
+            return zlib.decompressobj(AUTO_WBITS)
+        return _zstandard().ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            out.append(self._obj.decompress(data))
+            self.pending = not self._obj.eof
+            if self.pending:
+                break
+            data = self._obj.unused_data
+            self._obj = self._new()
+        return b"".join(out)
+
+
+async def compress_stream(
+    chunks: AsyncIterable[bytes] | Iterable[bytes], encoding: Encoding, level: int | None = None
+) -> AsyncIterator[bytes]:
+    """Compress a stream of bytes, in a worker thread so that the event loop is never blocked."""
+    obj = compressor(encoding, level)
+    async for chunk in aiterate(chunks):
+        if out := await asyncio.to_thread(obj.compress, chunk):
+            yield out
+    if out := await asyncio.to_thread(obj.flush):
+        yield out
+
+
+async def decompress_stream(chunks: AsyncIterable[bytes] | Iterable[bytes], encoding: Encoding) -> AsyncIterator[bytes]:
+    """Decompress a stream of bytes on the fly, in a worker thread."""
+    obj = Decompressor(encoding)
+    async for chunk in aiterate(chunks):
+        if out := await asyncio.to_thread(obj.decompress, chunk):
+            yield out
+    if obj.pending:
+        raise ValueError(f"Truncated {encoding} stream")
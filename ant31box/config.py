@@ -4,7 +4,7 @@ import json
 import logging
 import logging.config
 import os
-from typing import Any, Self
+from typing import Any, Literal, Self
 
 import yaml
 from pydantic import BaseModel, ConfigDict, Field, field_validator
@@ -54,6 +54,9 @@ class BaseConfig(BaseModel):
 class AppConfigSchema(BaseConfig):
     env: str = Field(default="dev")
     prometheus_dir: str = Field(default="/tmp/prometheus")
+    prometheus_multiprocess: bool = Field(
+        default=False, description="Collect prometheus metrics of all worker processes in `prometheus_dir`."
+    )
     seeder: str | None = Field(default=None, description="Import string for the database seeder function.")
 
 
@@ -126,6 +129,51 @@ class SentryConfigSchema(BaseConfig):
 ENVPREFIX = "ANT31BOX"
 
 
+class DiskCacheConfigSchema(BaseConfig):
+    enabled: bool = Field(default=False, description="Serve repeated downloads from a local disk cache.")
+    path: str = Field(default="/tmp/ant31box-cache", description="Directory holding the cached files.")
+    max_bytes: int = Field(default=10 * 1024**3, description="Byte budget of the cache, enforced with LRU eviction.")
+    hardlink: bool = Field(
+        default=False,
+        description="Serve hits by hardlinking cached files instead of copying them. "
+        "The destination then shares its content with the cache and must not be modified in place.",
+    )
+
+
+class S3TransferConfigSchema(BaseConfig):
+    multipart_threshold: int = Field(
+        default=8 * 1024 * 1024, description="Object size in bytes above which multipart transfers are used."
+    )
+    multipart_chunksize: int = Field(default=8 * 1024 * 1024, description="Size in bytes of each multipart part.")
+    max_concurrency: int = Field(default=10, description="Maximum number of parts transferred concurrently.")
+    max_in_flight_bytes: int = Field(
+        default=256 * 1024 * 1024, description="Upper bound of bytes buffered in memory while uploading parts."
+    )
+
+
+class S3RetryConfigSchema(BaseConfig):
+    mode: Literal["legacy", "standard", "adaptive"] | None = Field(
+        default=None,
+        description="botocore retry mode. 'adaptive' adds client-side rate limiting that backs off on SlowDown "
+        "(503) throttling. None keeps the botocore default.",
+    )
+    max_attempts: int | None = Field(default=None, description="Maximum attempts per request, including the first.")
+
+
+class S3HedgeConfigSchema(BaseConfig):
+    enabled: bool = Field(
+        default=False, description="Send a second GET when the first has not responded within the deadline."
+    )
+    percentile: float = Field(
+        default=95.0, description="Percentile of recent GET latencies used as the hedging deadline."
+    )
+    initial_delay: float = Field(
+        default=0.1, description="Hedging deadline in seconds until enough latencies have been observed."
+    )
+    min_delay: float = Field(default=0.01, description="Lower bound in seconds of the hedging deadline.")
+    window: int = Field(default=1000, description="Number of recent GET latencies the percentile is computed on.")
+
+
 class S3ConfigSchema(BaseConfig):
     endpoint: str | None = Field(default=None)
     access_key: str = Field(default="")
@@ -133,6 +181,65 @@ class S3ConfigSchema(BaseConfig):
     region: str = Field(default="eu-central-1")
     prefix: str = Field(default="")
     bucket: str = Field(default="abucket")
+    max_pool_connections: int = Field(
+        default=10, description="Maximum number of pooled HTTP connections kept by the S3 client."
+    )
+    tcp_keepalive: bool = Field(default=True, description="Enable TCP keepalive on pooled S3 connections.")
+    transfer: S3TransferConfigSchema = Field(default_factory=S3TransferConfigSchema)
+    cache: DiskCacheConfigSchema = Field(default_factory=DiskCacheConfigSchema)
+    presign_expires_in: int = Field(default=3600, description="Default validity in seconds of presigned URLs.")
+    presign_cache_size: int = Field(
+        default=4096, description="Maximum number of presigned URLs kept for reuse, 0 disables the cache."
+    )
+    metrics: bool = Field(default=False, description="Export prometheus metrics of S3 operations.")
+    retry: S3RetryConfigSchema = Field(default_factory=S3RetryConfigSchema)
+    hedge: S3HedgeConfigSchema = Field(default_factory=S3HedgeConfigSchema)
+
+
+class DownloadConfigSchema(BaseConfig):
+    local_copy: Literal["copy", "hardlink", "reflink"] = Field(
+        default="copy",
+        description="How local files are copied: in-kernel copy, or hardlink/reflink on the same filesystem "
+        "(falling back to a copy). Hardlinked destinations share their content with the source.",
+    )
+    chunk_size: int = Field(
+        default=1024 * 1024, description="Size in bytes of the chunks HTTP bodies are streamed to their output in."
+    )
+    connections: int = Field(
+        default=1, description="Parallel range requests per HTTP download to a file, 1 disables ranged downloads."
+    )
+    part_size: int = Field(default=8 * 1024 * 1024, description="Size in bytes of each range of a ranged download.")
+    resume: bool = Field(
+        default=False,
+        description="Download files to a `.part` file kept on failure, and continue it on retry when the source "
+        "is unchanged. Resumable downloads use a single connection.",
+    )
+    cache: DiskCacheConfigSchema = Field(
+        default_factory=lambda: DiskCacheConfigSchema(path="/tmp/ant31box-http-cache"),
+        description="HTTP cache revalidated with ETag/Last-Modified and honouring Cache-Control max-age.",
+    )
+    concurrency: int = Field(default=16, description="Maximum downloads in flight in download_many.")
+    per_host_concurrency: int = Field(
+        default=4, description="Maximum downloads in flight per http(s) host or s3 bucket in download_many."
+    )
+    digests: list[str] = Field(
+        default=["sha256"], description="hashlib algorithms computed by content-addressed downloads, sha256 always."
+    )
+    spool_max_size: int = Field(
+        default=8 * 1024 * 1024,
+        description="Size in bytes up to which download_spooled keeps content in memory before spilling to disk.",
+    )
+    decode_content: bool = Field(
+        default=False,
+        description="Decompress gzip and zstd Content-Encoding on the fly: s3 objects, and the http bodies aiohttp "
+        "leaves encoded (zstd before aiohttp 3.13). zstd needs the 'zstd' extra. Resumable downloads keep "
+        "the encoded bytes.",
+    )
+    coalesce: bool = Field(
+        default=False,
+        description="Share a single transfer between concurrent downloads of the same http(s) or s3 source, "
+        "the other callers getting a copy (see local_copy) of its result.",
+    )
 
 
 class DatabaseConfig(BaseConfig):
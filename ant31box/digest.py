@@ -0,0 +1,62 @@
+import hashlib
+from collections.abc import Iterable
+
+
+class ContentDigest:
+    """
+    Incremental digests of a byte stream, fed chunk by chunk as it is read or written.
+
+    Besides the requested hashlib algorithms, it can compute the ETag S3 assigns to the same
+    bytes when uploaded with `etag_part_size` parts above `etag_threshold` bytes.
+    """
+
+    def __init__(
+        self,
+        algorithms: Iterable[str] = ("sha256",),
+        etag_part_size: int | None = None,
+        etag_threshold: int | None = None,
+    ):
+        self._hashes = {name: hashlib.new(name) for name in algorithms}
+        self.size: int = 0
+        self.etag_part_size = etag_part_size
+        self.etag_threshold = etag_threshold if etag_threshold is not None else etag_part_size
+        self._md5 = hashlib.md5(usedforsecurity=False)
+        self._part = hashlib.md5(usedforsecurity=False)
+        self._part_size = 0
+        self._part_digests: list[bytes] = []
+
+    def update(self, data: bytes | bytearray | memoryview) -> None:
+        for h in self._hashes.values():
+            h.update(data)
+        self.size += len(data)
+        if self.etag_part_size is None:
+            return
+        self._md5.update(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.etag_part_size - self._part_size)
+            self._part.update(view[:take])
+            self._part_size += take
+            view = view[take:]
+            if self._part_size == self.etag_part_size:
+                self._part_digests.append(self._part.digest())
+                self._part = hashlib.md5(usedforsecurity=False)
+                self._part_size = 0
+
+    def hexdigest(self, algorithm: str = "sha256") -> str:
+        return self._hashes[algorithm].hexdigest()
+
+    def hexdigests(self) -> dict[str, str]:
+        return {name: h.hexdigest() for name, h in self._hashes.items()}
+
+    @property
+    def etag(self) -> str:
+        """The S3 ETag of the bytes seen so far, without quotes."""
+        if self.etag_part_size is None:
+            raise ValueError("etag_part_size is required to compute the ETag")
+        if self.etag_threshold is not None and self.size < self.etag_threshold:
+            return self._md5.hexdigest()
+        parts = list(self._part_digests)
+        if self._part_size or not parts:
+            parts.append(self._part.digest())
+        return f"{hashlib.md5(b''.join(parts), usedforsecurity=False).hexdigest()}-{len(parts)}"
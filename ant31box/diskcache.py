@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from io import IOBase
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import aiofiles
+from pydantic import BaseModel, Field
+
+from ant31box.config import DiskCacheConfigSchema
+from ant31box.localcopy import copy_file, copy_to_fileobj
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class CacheStats(BaseModel):
+    hits: int = Field(default=0, description="Lookups served from the cache.")
+    misses: int = Field(default=0, description="Lookups that had to go to the network.")
+    evictions: int = Field(default=0, description="Entries removed to stay within the byte budget.")
+
+
+class CacheEntry(BaseModel):
+    key: str = Field(..., description="Cache key, e.g. the source URL.")
+    path: Path = Field(..., description="Location of the cached content.")
+    size: int = Field(default=0, description="Size of the cached content in bytes.")
+    metadata: dict[str, str] = Field(default_factory=dict, description="Validators stored with the content.")
+
+
+class DiskCache:
+    """
+    On-disk content cache with a byte budget and LRU eviction.
+
+    Content is written to a temporary file inside the cache directory and renamed into place,
+    so readers never observe partial files. Each entry stores its validators (ETag, ...) in a
+    JSON sidecar, which is what survives restarts: the index is rebuilt from the sidecars on init.
+    """
+
+    def __init__(self, config: DiskCacheConfigSchema):
+        self.config = config
+        self.root = Path(config.path)
+        self.max_bytes = config.max_bytes
+        self.stats = CacheStats()
+        self._index: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._size = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _meta_path(self, name: str) -> Path:
+        return self.root.joinpath(f"{name}.json")
+
+    def _load(self) -> None:
+        entries: list[tuple[float, CacheEntry]] = []
+        for meta in self.root.glob("*.json"):
+            try:
+                entry = CacheEntry.model_validate_json(meta.read_bytes())
+                atime = entry.path.stat().st_atime
+            except (OSError, ValueError):
+                continue
+            entries.append((atime, entry))
+        for _, entry in sorted(entries, key=lambda e: e[0]):
+            self._index[self._name(entry.key)] = entry
+            self._size += entry.size
+        self._evict()
+
+    def lookup(self, key: str, **expected: str) -> CacheEntry | None:
+        """
+        Return the entry for `key` if its stored metadata matches every `expected` validator.
+
+        A stale entry is dropped. Hits and misses are counted in `stats`: use `peek` when the entry
+        still has to be revalidated before being served.
+        """
+        entry = self.peek(key, **expected)
+        self.record(entry is not None)
+        return entry
+
+    def peek(self, key: str, **expected: str) -> CacheEntry | None:
+        """Like `lookup`, without counting a hit or a miss: the caller calls `record` once it knows."""
+        name = self._name(key)
+        entry = self._index.get(name)
+        if entry is not None and any(entry.metadata.get(k) != v for k, v in expected.items()):
+            self._remove(name)
+            entry = None
+        if entry is None or not entry.path.exists():
+            return None
+        self._index.move_to_end(name)
+        return entry
+
+    def record(self, hit: bool) -> None:
+        """Count a request served from the cache, or one that had to go to the network."""
+        if hit:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+
+    def tempfile(self) -> Path:
+        """Path of a new temporary file on the cache filesystem, to be passed to `commit`."""
+        return self.root.joinpath(f".tmp-{uuid.uuid4().hex}")
+
+    def commit(self, key: str, tmp: Path, metadata: dict[str, str] | None = None) -> CacheEntry:
+        """Atomically move a fully written temporary file into the cache under `key`."""
+        name = self._name(key)
+        self._remove(name)
+        path = self.root.joinpath(name)
+        os.replace(tmp, path)
+        entry = CacheEntry(key=key, path=path, size=path.stat().st_size, metadata=metadata or {})
+        self._write_meta(name, entry)
+        self._index[name] = entry
+        self._size += entry.size
+        self._evict()
+        return entry
+
+    def update(self, key: str, metadata: dict[str, str]) -> CacheEntry | None:
+        """Replace the metadata of an entry, e.g. after a successful revalidation."""
+        name = self._name(key)
+        entry = self._index.get(name)
+        if entry is None:
+            return None
+        entry.metadata = metadata
+        self._write_meta(name, entry)
+        return entry
+
+    def _write_meta(self, name: str, entry: CacheEntry) -> None:
+        meta_tmp = self.tempfile()
+        meta_tmp.write_text(entry.model_dump_json(), encoding="utf-8")
+        os.replace(meta_tmp, self._meta_path(name))
+
+    def discard(self, key: str) -> None:
+        self._remove(self._name(key))
+
+    def _remove(self, name: str) -> None:
+        entry = self._index.pop(name, None)
+        if entry is not None:
+            self._size -= entry.size
+        self._meta_path(name).unlink(missing_ok=True)
+        self.root.joinpath(name).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        # The most recent entry is never evicted, even if it exceeds the budget on its own
+        while self._size > self.max_bytes and len(self._index) > 1:
+            name, entry = next(iter(self._index.items()))
+            logger.debug("cache evict key='%s' size=%d", entry.key, entry.size)
+            self._remove(name)
+            self.stats.evictions += 1
+
+    async def materialize(self, entry: CacheEntry, dest: str | Path | IOBase | BinaryIO | Any) -> None:
+        """Copy, or hardlink when configured, a cached entry to a path or a (sync or async) file object."""
+        if isinstance(dest, str | Path):
+            await asyncio.to_thread(copy_file, entry.path, dest, "hardlink" if self.config.hardlink else "copy")
+            return
+        if isinstance(dest, IOBase):
+            await asyncio.to_thread(copy_to_fileobj, entry.path, dest, COPY_CHUNK_SIZE)
+            return
+        async with aiofiles.open(entry.path, "rb") as fopen:
+            while chunk := await fopen.read(COPY_CHUNK_SIZE):
+                ret = dest.write(chunk)
+                if inspect.isawaitable(ret):
+                    await ret
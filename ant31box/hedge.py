@@ -0,0 +1,102 @@
+import asyncio
+import math
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+# Samples needed before the observed percentile replaces the initial delay
+MIN_SAMPLES = 20
+
+
+class LatencyWindow:
+    """
+    Sliding window of recent request latencies, used to derive the hedging deadline.
+
+    Until `MIN_SAMPLES` latencies are known the deadline is `initial`, then it is the
+    `percentile` of the window, never below `minimum`.
+    """
+
+    def __init__(self, size: int, percentile: float, initial: float, minimum: float = 0.0):
+        self._samples: deque[float] = deque(maxlen=max(1, size))
+        self.percentile = percentile
+        self.initial = initial
+        self.minimum = minimum
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def deadline(self) -> float:
+        if len(self._samples) < MIN_SAMPLES:
+            return max(self.initial, self.minimum)
+        ordered = sorted(self._samples)
+        rank = max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(ordered[min(rank, len(ordered) - 1)], self.minimum)
+
+    def timed[T](self, call: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+        """
+        Wrap `call` so that the latency of every successful call is recorded.
+
+        A call cancelled after the deadline, typically the slow request losing to its hedge, is recorded
+        with its elapsed time: its latency is at least that, and leaving it out would hide the tail.
+        """
+
+        async def wrapper() -> T:
+            start = time.perf_counter()
+            deadline = self.deadline()
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                if (elapsed := time.perf_counter() - start) >= deadline:
+                    self.record(elapsed)
+                raise
+            self.record(time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+
+async def hedged[T](
+    call: Callable[[], Awaitable[T]],
+    delay: float,
+    *,
+    discard: Callable[[T], Any] | None = None,
+    on_hedge: Callable[[], Any] | None = None,
+) -> T:
+    """
+    Await `call()`, starting a second identical call if the first has not completed after `delay` seconds.
+
+    The first successful result wins and the other call is cancelled, or passed to `discard` when it
+    completed as well (e.g. to release a response body). If both calls fail, the first call's error is raised.
+    """
+    first = asyncio.ensure_future(call())
+    try:
+        await asyncio.wait({first}, timeout=delay)
+    except BaseException:
+        first.cancel()
+        raise
+    if first.done():
+        return first.result()
+
+    if on_hedge is not None:
+        on_hedge()
+    tasks = [first, asyncio.ensure_future(call())]
+    pending: set[asyncio.Future[T]] = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in tasks if task in done and task.exception() is None]
+            if winners:
+                for extra in winners[1:]:
+                    if discard is not None:
+                        discard(extra.result())
+                return winners[0].result()
+        for task in tasks[1:]:
+            task.exception()
+        return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
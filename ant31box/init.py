@@ -6,7 +6,8 @@ import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.starlette import StarletteIntegration
 
-from ant31box.config import Config, ConfigSchema, SentryConfigSchema
+from ant31box.config import AppConfigSchema, Config, ConfigSchema, SentryConfigSchema
+from ant31box.metrics import enable_multiprocess
 
 
 def init_sentry(config: SentryConfigSchema, integration_app: str = ""):
@@ -29,8 +30,14 @@ def _create_tmp_dir(promdir: str) -> None:
     pathlib.Path(promdir).mkdir(parents=True, exist_ok=True)
 
 
+def init_prometheus(config: AppConfigSchema) -> None:
+    _create_tmp_dir(config.prometheus_dir)
+    if config.prometheus_multiprocess:
+        enable_multiprocess(config.prometheus_dir)
+
+
 def init(config: ConfigSchema, app: str = "fastapi"):
-    _create_tmp_dir(config.app.prometheus_dir)
+    init_prometheus(config.app)
     init_sentry(config.sentry, app)
 
 
@@ -39,5 +46,5 @@ def init_from_config(config: Config, app: str = "fastapi"):
     Initialize the application from a Config object.
     This is the recommended way for initialization.
     """
-    _create_tmp_dir(config.app.prometheus_dir)
+    init_prometheus(config.app)
     init_sentry(config.sentry, app)
@@ -0,0 +1,124 @@
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import Any, BinaryIO, Literal
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+type CopyMode = Literal["copy", "hardlink", "reflink"]
+
+CHUNK_SIZE = 8 * 1024 * 1024
+# linux/fs.h: share the source extents with the destination (btrfs, xfs, ...)
+FICLONE = 0x40049409
+# Errors telling a fast path is not available for these files, as opposed to a failed copy
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM}
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int) -> str:
+    """
+    Copy a file descriptor to another in the kernel when possible, returns the technique used.
+
+    `size` is a hint only: the kernel copies run until the source is exhausted, and a source reporting
+    a size of 0 (procfs, sysfs, ...) goes straight to the read/write loop as its content is generated on read.
+    """
+    copied = 0
+    if size and hasattr(os, "copy_file_range"):
+        try:
+            while n := os.copy_file_range(src_fd, dst_fd, max(size - copied, CHUNK_SIZE), copied, copied):
+                copied += n
+            if copied:
+                return "copy_file_range"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    if size:
+        try:
+            os.lseek(dst_fd, copied, os.SEEK_SET)
+            while n := os.sendfile(dst_fd, src_fd, copied, min(max(size - copied, CHUNK_SIZE), 1 << 30)):
+                copied += n
+            if copied:
+                return "sendfile"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dst_fd, copied, os.SEEK_SET)
+    while chunk := os.read(src_fd, CHUNK_SIZE):
+        os.write(dst_fd, chunk)
+    return "read"
+
+
+def copy_file(src: str | Path, dst: str | Path, mode: CopyMode = "copy") -> str:
+    """
+    Copy a file without moving its content through Python.
+
+    Args:
+        src: Source path.
+        dst: Destination path, replaced if it exists.
+        mode: `hardlink` links the destination to the source and `reflink` shares its extents (copy-on-write),
+            both on the same filesystem only. `copy`, and the other modes when they are not possible,
+            copy the bytes with copy_file_range, then sendfile, then a plain read/write loop.
+
+    Returns:
+        The technique used: hardlink, reflink, copy_file_range, sendfile or read.
+
+    Raises:
+        shutil.SameFileError: `src` and `dst` are the same path, the file is left untouched.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        if os.path.realpath(src) == os.path.realpath(dst):
+            raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+        if mode == "hardlink":
+            # Already linked, e.g. a cache entry materialized again to the same path
+            return "hardlink"
+        # Another link to the source: replaced by a copy rather than truncating the shared content
+        Path(dst).unlink()
+    if mode == "hardlink":
+        try:
+            Path(dst).unlink(missing_ok=True)
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            logger.debug("hardlink failed, copying instead: %s", e)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if mode == "reflink":
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return "reflink"
+            except OSError as e:
+                logger.debug("reflink failed, copying instead: %s", e)
+        technique = _copy_fd(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno()).st_size)
+    shutil.copymode(src, dst)
+    return technique
+
+
+def copy_to_fileobj(src: str | Path, fileobj: BinaryIO | Any, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Write a file into a file object from a memory map, `chunk_size` bytes at a time.
+
+    The map is backed by the page cache: memory use does not grow with the file size. Files reporting
+    a size of 0 (procfs, sysfs, ...) are read `chunk_size` bytes at a time instead, as their content
+    is generated on read.
+
+    Returns:
+        The number of bytes written.
+    """
+    with open(src, "rb") as fsrc:
+        size = os.fstat(fsrc.fileno()).st_size
+        if not size:
+            written = 0
+            while chunk := fsrc.read(chunk_size):
+                fileobj.write(chunk)
+                written += len(chunk)
+            return written
+        with mmap.mmap(fsrc.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, size, chunk_size):
+                    with view[start : start + chunk_size] as part:
+                        fileobj.write(part)
+    return size
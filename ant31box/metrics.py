@@ -0,0 +1,91 @@
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import cache
+from typing import Any
+
+from botocore.exceptions import ClientError
+from prometheus_client import Counter, Histogram, values
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def enable_multiprocess(promdir: str) -> None:
+    """
+    Switch prometheus_client to multiprocess mode, storing samples in `promdir`.
+
+    Only metrics created afterwards are affected, which is why the S3 metrics are created lazily.
+    An explicit PROMETHEUS_MULTIPROC_DIR environment variable takes precedence.
+    """
+    if MULTIPROC_ENV in os.environ or MULTIPROC_ENV.lower() in os.environ:
+        return
+    os.environ[MULTIPROC_ENV] = promdir
+    # prometheus_client selects its value class from the environment once, when it is imported:
+    # let it select again now that the variable is set, so metrics created from now on are file-backed
+    values.ValueClass = values.get_value_class()
+
+
+class S3Metrics:
+    """Latency, bytes, error and retry metrics of S3 operations, labelled by bucket."""
+
+    def __init__(self) -> None:
+        self.latency = Histogram(
+            "ant31box_s3_operation_duration_seconds",
+            "Duration of S3 operations",
+            ["operation", "bucket"],
+        )
+        self.bytes = Counter(
+            "ant31box_s3_transferred_bytes",
+            "Bytes transferred by S3 operations",
+            ["operation", "bucket"],
+        )
+        self.errors = Counter(
+            "ant31box_s3_errors",
+            "Failed S3 operations",
+            ["operation", "bucket", "code"],
+        )
+        self.retries = Counter(
+            "ant31box_s3_retries",
+            "Retried S3 API calls",
+            ["api", "bucket"],
+        )
+        self.hedges = Counter(
+            "ant31box_s3_hedged_requests",
+            "GET requests duplicated because the first one exceeded the hedging deadline",
+            ["bucket"],
+        )
+
+    @contextmanager
+    def observe(self, operation: str, bucket: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            code = e.response.get("Error", {}).get("Code", "") if isinstance(e, ClientError) else type(e).__name__
+            self.errors.labels(operation, bucket, code).inc()
+            raise
+        finally:
+            self.latency.labels(operation, bucket).observe(time.perf_counter() - start)
+
+    def add_bytes(self, operation: str, bucket: str, size: int) -> None:
+        self.bytes.labels(operation, bucket).inc(size)
+
+    def add_hedge(self, bucket: str) -> None:
+        self.hedges.labels(bucket).inc()
+
+    def on_after_call(self, *, parsed: dict[str, Any], model: Any, context: dict[str, Any], **_: Any) -> None:
+        """botocore `after-call` hook counting the retries of every API call, managed transfers included."""
+        attempts = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if attempts:
+            bucket = context.get("s3_redirect", {}).get("bucket", "")
+            self.retries.labels(model.name, bucket).inc(attempts)
+
+
+@cache
+def s3_metrics() -> S3Metrics:
+    """The process-wide S3 metrics, registered on first use."""
+    return S3Metrics()
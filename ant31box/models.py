@@ -1,10 +1,11 @@
 import hashlib
 import hmac
+from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 from urllib.parse import urlparse
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class S3Dest(BaseModel):
@@ -55,6 +56,36 @@ class S3URL:
         return Path(self.key).name
 
 
+class PresignedURL(BaseModel):
+    url: str = Field(..., description="Presigned HTTPS URL.")
+    method: Literal["GET", "PUT"] = Field(..., description="HTTP method the URL is signed for.")
+    expires_at: datetime = Field(..., description="Time after which the URL is rejected by S3.")
+    dest: S3Dest = Field(..., description="Object the URL gives access to.")
+
+
+class TransferResult(BaseModel):
+    """Outcome of one item of a batch transfer: either `result` or `error` is set."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    source: Any = Field(..., description="Source of the transfer as given by the caller.")
+    dest: Any = Field(..., description="Destination of the transfer as given by the caller.")
+    result: Any = Field(default=None, description="Value returned by the transfer on success.")
+    error: BaseException | None = Field(default=None, description="Exception raised by the transfer, if any.")
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class DeleteResult(BaseModel):
+    deleted: int = Field(default=0, description="Number of keys deleted.")
+    errors: dict[str, str] = Field(default_factory=dict, description="Error message per key that was not deleted.")
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
 class Job(BaseModel):
     uuid: str = Field(...)
     name: str = Field(...)
@@ -1,23 +1,63 @@
+import asyncio
+import inspect
 import logging
+import time
 import warnings
+import weakref
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+from contextlib import AbstractContextManager, AsyncExitStack, nullcontext, suppress
+from datetime import UTC, datetime, timedelta
 from io import IOBase
 from pathlib import Path
-from typing import BinaryIO
+from typing import Any, BinaryIO, Literal
 
 import aioboto3
+import aiofiles
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.exceptions import ClientError
+from cachetools import TLRUCache
 
-from ant31box.asyncutils import make_sync
-from ant31box.config import S3ConfigSchema
-from ant31box.models import S3URL, S3Dest
+from ant31box.asyncutils import STOP_TIMEOUT, aiterate, make_sync, on_loop_stop
+from ant31box.codec import Encoding, compress_stream, decompress_stream, encoding_of
+from ant31box.config import S3ConfigSchema, S3TransferConfigSchema
+from ant31box.digest import ContentDigest
+from ant31box.diskcache import DiskCache
+from ant31box.hedge import LatencyWindow, hedged
+from ant31box.metrics import S3Metrics, s3_metrics
+from ant31box.models import S3URL, PresignedURL, S3Dest
+from ant31box.s3batch import MAX_PARTS, S3BatchMixin, TransferMeter
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+_DONE = object()
+# User metadata key holding the sha256 of objects uploaded with skip_unchanged
+SHA256_METADATA = "sha256"
+HASH_CHUNK_SIZE = 1024 * 1024
 
-class S3Client:
+# Every S3Client registers itself here so the server lifespan can close the pooled connections on shutdown.
+_clients: "weakref.WeakSet[S3Client]" = weakref.WeakSet()
+
+
+async def close_clients(loop: asyncio.AbstractEventLoop | None = None) -> None:
+    """Close the pooled connections of every live S3Client, only those opened on `loop` when given."""
+    for client in list(_clients):
+        await client.close(loop)
+
+
+async def _close_loop_clients() -> None:
+    await close_clients(asyncio.get_running_loop())
+
+
+# The sync facades' background loop closes the connections it opened before stopping
+on_loop_stop(_close_loop_clients)
+
+
+class S3Client(S3BatchMixin):
     def __init__(self, options: S3ConfigSchema, bucket: str = "", prefix: str = ""):
-        self.options = options
+        self.options: S3ConfigSchema = options
         self.session = aioboto3.Session(**self._boto_session_args(options))
         if not bucket:
             bucket = options.bucket
@@ -25,6 +65,97 @@ class S3Client:
             prefix = options.prefix
         self.bucket: str = bucket
         self.prefix: str = prefix
+        # One pooled client per event loop, with the exit stack closing it
+        self._pooled: dict[asyncio.AbstractEventLoop, tuple[Any, AsyncExitStack]] = {}
+        self._client_locks: dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+        self.cache: DiskCache | None = DiskCache(options.cache) if options.cache.enabled else None
+        self.metrics: S3Metrics | None = s3_metrics() if options.metrics else None
+        hedge = options.hedge
+        self._get_latency = LatencyWindow(hedge.window, hedge.percentile, hedge.initial_delay, hedge.min_delay)
+        # Presigned URLs are handed out again until half of their validity has elapsed
+        self._presigned: TLRUCache[tuple[str, str, str, int], PresignedURL] | None = None
+        if options.presign_cache_size > 0:
+            self._presigned = TLRUCache(
+                maxsize=options.presign_cache_size,
+                ttu=lambda _, value, now: now + (value.expires_at.timestamp() - now) / 2,
+                timer=time.time,
+            )
+        _clients.add(self)
+
+    async def __aenter__(self) -> "S3Client":
+        await self.client()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def client(self):
+        """
+        Return the long-lived aioboto3 S3 client of the running event loop, opening it on first use.
+
+        The client owns the connection pool, so it is bound to the event loop that opened it.
+        Each loop calling (e.g. the application loop and the sync facades' background loop) gets its own
+        client, kept until `close`. Clients of loops closed in the meantime are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        pooled = self._pooled.get(loop)
+        if pooled is not None:
+            return pooled[0]
+        lock = self._client_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            if loop not in self._pooled:
+                self._forget_closed_loops()
+                stack = AsyncExitStack()
+                client = await stack.enter_async_context(
+                    self.session.client("s3", **self._boto_client_args(self.options))
+                )
+                if self.metrics is not None:
+                    client.meta.events.register("after-call.s3", self.metrics.on_after_call)
+                self._pooled[loop] = (client, stack)
+        return self._pooled[loop][0]
+
+    def _forget_closed_loops(self) -> None:
+        # The connections of a closed loop cannot be awaited anymore
+        for loop in [loop for loop in self._client_locks if loop.is_closed()]:
+            self._pooled.pop(loop, None)
+            del self._client_locks[loop]
+
+    async def close(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        """
+        Close the pooled clients, or only the one opened on `loop`. A new one is opened on the next call.
+
+        A client of another running loop is closed on that loop, waiting up to `STOP_TIMEOUT` seconds.
+        """
+        current = asyncio.get_running_loop()
+        loops = list(self._pooled) if loop is None else [loop]
+        for owner in loops:
+            pooled = self._pooled.pop(owner, None)
+            if pooled is None:
+                continue
+            stack = pooled[1]
+            if owner is current:
+                await stack.aclose()
+            elif owner.is_running():
+                closing = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(stack.aclose(), owner))
+                # Not cancelled on timeout: the client is closed once its loop gets to it
+                done, _ = await asyncio.wait([closing], timeout=STOP_TIMEOUT)
+                if not done:
+                    logger.warning("timed out closing the S3 client of another event loop")
+                else:
+                    closing.result()
+            elif not owner.is_closed():
+                logger.debug("dropping the S3 client of a stopped event loop")
+        self._forget_closed_loops()
+
+    def _observe(self, operation: str, bucket: str) -> AbstractContextManager[None]:
+        """Time `operation` and count its failures when metrics are enabled."""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.observe(operation, bucket)
+
+    def _count_bytes(self, operation: str, bucket: str, size: int) -> None:
+        if self.metrics is not None:
+            self.metrics.add_bytes(operation, bucket, size)
 
     @property
     def sync_client(self):
@@ -57,9 +188,32 @@ class S3Client:
         kwargs: dict = {}
         if options.endpoint:
             kwargs["endpoint_url"] = options.endpoint
-        kwargs["config"] = Config(signature_version="s3v4")
+        retries: dict[str, Any] = {}
+        if options.retry.mode is not None:
+            retries["mode"] = options.retry.mode
+        if options.retry.max_attempts is not None:
+            retries["total_max_attempts"] = options.retry.max_attempts
+        config_args: dict[str, Any] = {
+            "signature_version": "s3v4",
+            "max_pool_connections": options.max_pool_connections,
+            "tcp_keepalive": options.tcp_keepalive,
+        }
+        if retries:
+            config_args["retries"] = retries
+        kwargs["config"] = Config(**config_args)
         return kwargs
 
+    def transfer_config(self, transfer: S3TransferConfigSchema | None = None) -> TransferConfig:
+        """Build the boto3 TransferConfig from the client options, or from a per-call override."""
+        if transfer is None:
+            transfer = self.options.transfer
+        return TransferConfig(
+            multipart_threshold=transfer.multipart_threshold,
+            multipart_chunksize=transfer.multipart_chunksize,
+            max_concurrency=transfer.max_concurrency,
+            max_io_queue=max(1, transfer.max_in_flight_bytes // transfer.multipart_chunksize),
+        )
+
     def buildpath(self, filename: str, dest: str = ""):
         if not dest:
             dest = Path(filename).name
@@ -79,18 +233,230 @@ class S3Client:
         )
         return await self.upload_file_async(filepath, dest)
 
-    async def upload_file_async(self, filepath: str | IOBase | BinaryIO, dest: str = "") -> S3Dest:
+    async def upload_file_async(
+        self,
+        filepath: str | IOBase | BinaryIO,
+        dest: str = "",
+        transfer: S3TransferConfigSchema | None = None,
+        skip_unchanged: bool = False,
+        *,
+        encoding: Encoding | None = None,
+    ) -> S3Dest:
+        """
+        Upload a local file or a file object.
+
+        With `skip_unchanged`, the source is hashed first and the upload is skipped when the destination
+        already holds the same content, as told by its sha256 metadata or its ETag. Uploads made in this
+        mode store the sha256 in the object metadata. File objects must be seekable to be hashed.
+
+        With `encoding` (gzip or zstd), the content is compressed on the fly and stored with that
+        Content-Encoding, see `upload_stream_async`. It cannot be combined with `skip_unchanged`.
+        """
         path = dest if isinstance(filepath, (IOBase, BinaryIO)) else self.buildpath(filepath, dest)
+        if encoding is not None:
+            if skip_unchanged:
+                raise ValueError("skip_unchanged is not supported with an encoding")
+            return await self.upload_stream_async(self._read_source(filepath), path, transfer, encoding=encoding)
         logger.info("upload s3 bucket='%s' file='%s' dest='%s'", self.bucket, filepath, path)
+        res = S3URL(bucket=self.bucket, key=path, region=self.options.region).to_model()
 
-        async with self.session.resource("s3", **self._boto_client_args(self.options)) as s3:
-            bucket = await s3.Bucket(self.bucket)
+        extra_args: dict[str, Any] | None = None
+        if skip_unchanged:
+            digest = await self._digest_source(filepath, transfer or self.options.transfer)
+            if digest is not None:
+                if await self._has_content(res, digest):
+                    logger.info("upload skipped, content unchanged url='%s'", res.url)
+                    return res
+                extra_args = {"Metadata": {SHA256_METADATA: digest.hexdigest()}}
+
+        client = await self.client()
+        meter = TransferMeter("upload")
+        with self._observe("upload", self.bucket):
             if isinstance(filepath, str):
-                await bucket.upload_file(filepath, path)
+                await client.upload_file(
+                    filepath,
+                    self.bucket,
+                    path,
+                    ExtraArgs=extra_args,
+                    Callback=meter,
+                    Config=self.transfer_config(transfer),
+                )
+            else:
+                await client.upload_fileobj(
+                    filepath,
+                    self.bucket,
+                    path,
+                    ExtraArgs=extra_args,
+                    Callback=meter,
+                    Config=self.transfer_config(transfer),
+                )
+
+        self._count_bytes("upload", self.bucket, meter.bytes)
+        meter.log(res.url)
+        return res
+
+    @staticmethod
+    async def _read_source(source: str | IOBase | BinaryIO) -> AsyncIterator[bytes]:
+        if isinstance(source, str):
+            async with aiofiles.open(source, "rb") as fopen:
+                while chunk := await fopen.read(HASH_CHUNK_SIZE):
+                    yield chunk
+            return
+        while chunk := await asyncio.to_thread(source.read, HASH_CHUNK_SIZE):
+            yield chunk
+
+    @staticmethod
+    async def _digest_source(source: str | IOBase | BinaryIO, transfer: S3TransferConfigSchema) -> ContentDigest | None:
+        """Hash a path or a seekable file object, rewinding the file object afterwards."""
+        digest = ContentDigest(etag_part_size=transfer.multipart_chunksize, etag_threshold=transfer.multipart_threshold)
+
+        def consume(fileobj: Any) -> None:
+            while chunk := fileobj.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+
+        if isinstance(source, str):
+            with open(source, "rb") as fileobj:
+                await asyncio.to_thread(consume, fileobj)
+            return digest
+        if not source.seekable():
+            logger.warning("cannot hash a non-seekable source, uploading unconditionally")
+            return None
+        pos = source.tell()
+        await asyncio.to_thread(consume, source)
+        source.seek(pos)
+        return digest
+
+    async def _has_content(self, s3url: S3Dest, digest: ContentDigest) -> bool:
+        client = await self.client()
+        try:
+            head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+                return False
+            raise
+        if head["ContentLength"] != digest.size:
+            return False
+        if (sha256 := head.get("Metadata", {}).get(SHA256_METADATA)) is not None:
+            return sha256 == digest.hexdigest()
+        return head["ETag"].strip('"') == digest.etag
+
+    async def upload_stream_async(
+        self,
+        chunks: AsyncIterable[bytes] | Iterable[bytes],
+        dest: str,
+        transfer: S3TransferConfigSchema | None = None,
+        *,
+        bucket: str = "",
+        extra_args: dict[str, Any] | None = None,
+        encoding: Encoding | None = None,
+    ) -> S3Dest:
+        """
+        Upload a stream of bytes of unknown length, e.g. a generator or an aiohttp response body.
+
+        The stream is cut into `multipart_chunksize` parts uploaded `max_concurrency` at a time, so memory
+        stays proportional to part size times concurrency whatever the object size. Streams shorter than one part
+        are sent with a single PutObject. The multipart upload is aborted if the stream or any part fails.
+
+        Args:
+            chunks: The object content, in order.
+            dest: Destination key.
+            transfer: Per-call transfer settings override.
+            bucket: Destination bucket, defaults to the client bucket.
+            extra_args: Extra CreateMultipartUpload/PutObject arguments, e.g. ContentType or Metadata.
+            encoding: Compress the stream with gzip or zstd, in a worker thread, and set the object
+                Content-Encoding accordingly.
+        """
+        transfer = transfer or self.options.transfer
+        part_size = transfer.multipart_chunksize
+        extra_args = extra_args or {}
+        bucket = bucket or self.bucket
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding)
+            extra_args = {**extra_args, "ContentEncoding": encoding}
+        logger.info("upload stream s3 bucket='%s' dest='%s'", bucket, dest)
+        res = S3URL(bucket=bucket, key=dest, region=self.options.region).to_model()
+        client = await self.client()
+        meter = TransferMeter("upload")
+        stream = aiter(aiterate(chunks))
+        buf = bytearray()
+
+        async def fill() -> bool:
+            # Accumulate up to one part, returns False once the stream is exhausted
+            while len(buf) < part_size:
+                chunk = await anext(stream, None)
+                if chunk is None:
+                    return False
+                buf.extend(chunk)
+            return True
+
+        with self._observe("upload", bucket):
+            if not await fill():
+                await client.put_object(Bucket=bucket, Key=dest, Body=bytes(buf), **extra_args)
+                meter(len(buf))
             else:
-                await bucket.upload_fileobj(filepath, path)
+                await self._upload_parts(res, buf, fill, transfer, extra_args=extra_args, meter=meter)
+        self._count_bytes("upload", bucket, meter.bytes)
+        meter.log(res.url)
+        return res
+
+    async def _upload_parts(
+        self,
+        s3url: S3Dest,
+        buf: bytearray,
+        fill: Callable[[], Awaitable[bool]],
+        transfer: S3TransferConfigSchema,
+        *,
+        extra_args: dict[str, Any],
+        meter: TransferMeter,
+    ) -> None:
+        client = await self.client()
+        part_size = transfer.multipart_chunksize
+        slots = asyncio.Semaphore(max(1, transfer.max_concurrency))
+        mpu = await client.create_multipart_upload(Bucket=s3url.bucket, Key=s3url.key, **extra_args)
+        upload_id = mpu["UploadId"]
+        etags: dict[int, str] = {}
+
+        async def upload_part(number: int, body: bytes) -> None:
+            try:
+                resp = await client.upload_part(
+                    Bucket=s3url.bucket, Key=s3url.key, UploadId=upload_id, PartNumber=number, Body=body
+                )
+                etags[number] = resp["ETag"]
+                meter(len(body))
+            finally:
+                slots.release()
 
-        return S3URL(bucket=self.bucket, key=path, region=self.options.region).to_model()
+        try:
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    number = 0
+                    more = True
+                    while more or buf:
+                        if not more or len(buf) >= part_size:
+                            number += 1
+                            if number > MAX_PARTS:
+                                raise ValueError(f"stream exceeds {MAX_PARTS} parts of {part_size} bytes")
+                            with memoryview(buf) as view:
+                                body = bytes(view[:part_size])
+                            del buf[:part_size]
+                            # Wait for a free slot before reading further: at most max_concurrency parts in flight
+                            await slots.acquire()
+                            tg.create_task(upload_part(number, body))
+                        if more:
+                            more = await fill()
+            except ExceptionGroup as eg:
+                # Surface the failing source or part, not the group
+                raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+            await client.complete_multipart_upload(
+                Bucket=s3url.bucket,
+                Key=s3url.key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": n, "ETag": etags[n]} for n in sorted(etags)]},
+            )
+        except BaseException:
+            logger.warning("aborting multipart upload url='%s'", s3url.url)
+            await client.abort_multipart_upload(Bucket=s3url.bucket, Key=s3url.key, UploadId=upload_id)
+            raise
 
     def s3url(self, path: str, strip: bool = True) -> S3URL:
         if strip:
@@ -111,14 +477,141 @@ class S3Client:
         )
         return await self.download_file_async(s3url, dest)
 
-    async def download_file_async(self, s3url: S3Dest, dest: str | Path | IOBase | BinaryIO) -> str | IOBase | BinaryIO:
+    async def download_file_async(
+        self,
+        s3url: S3Dest,
+        dest: str | Path | IOBase | BinaryIO,
+        transfer: S3TransferConfigSchema | None = None,
+        *,
+        decode: bool = False,
+    ) -> str | IOBase | BinaryIO:
+        """
+        Download an object to a local path or a file object.
+
+        When the disk cache is enabled, the object ETag is checked with a HEAD request and
+        unchanged objects are served from the cache without transferring their content.
+
+        With `decode`, objects stored with a gzip or zstd Content-Encoding are decompressed on the fly,
+        bypassing the cache. This costs a HEAD request to read the encoding.
+        """
         logger.info("download uri='%s', dest='%s'", s3url.url, dest)
-        async with self.session.resource("s3", **self._boto_client_args(self.options)) as s3:
-            bucket = await s3.Bucket(s3url.bucket)
+        if decode and (encoding := await self._content_encoding(s3url)) is not None:
+            transfer = transfer or self.options.transfer
+            chunks = self._stream(
+                s3url,
+                HASH_CHUNK_SIZE,
+                concurrency=max(1, transfer.max_concurrency),
+                part_size=transfer.multipart_chunksize,
+            )
+            await self._write_chunks(decompress_stream(chunks, encoding), dest, TransferMeter("download"), s3url)
+            return dest
+        if self.cache is not None:
+            return await self._download_cached(s3url, dest, transfer)
+        await self._download(s3url, dest, transfer)
+        return dest
+
+    async def _download(
+        self,
+        s3url: S3Dest,
+        dest: str | Path | IOBase | BinaryIO,
+        transfer: S3TransferConfigSchema | None = None,
+        extra_args: dict[str, Any] | None = None,
+    ) -> None:
+        if self.options.hedge.enabled:
+            await self._download_hedged(s3url, dest, transfer or self.options.transfer, extra_args)
+            return
+        client = await self.client()
+        meter = TransferMeter("download", cumulative=True)
+        with self._observe("download", s3url.bucket):
             if isinstance(dest, str | Path):
-                await bucket.download_file(s3url.key, str(dest))
+                await client.download_file(
+                    s3url.bucket,
+                    s3url.key,
+                    str(dest),
+                    ExtraArgs=extra_args,
+                    Callback=meter,
+                    Config=self.transfer_config(transfer),
+                )
             else:
-                await bucket.download_fileobj(s3url.key, dest)
+                await client.download_fileobj(
+                    s3url.bucket,
+                    s3url.key,
+                    dest,
+                    ExtraArgs=extra_args,
+                    Callback=meter,
+                    Config=self.transfer_config(transfer),
+                )
+        self._count_bytes("download", s3url.bucket, meter.bytes)
+        meter.log(s3url.url)
+
+    async def _download_hedged(
+        self,
+        s3url: S3Dest,
+        dest: str | Path | IOBase | BinaryIO,
+        transfer: S3TransferConfigSchema,
+        extra_args: dict[str, Any] | None = None,
+    ) -> None:
+        """Download through hedged ranged GETs, `max_concurrency` parts of `multipart_chunksize` at a time."""
+        chunks = self._stream(
+            s3url,
+            HASH_CHUNK_SIZE,
+            concurrency=max(1, transfer.max_concurrency),
+            part_size=transfer.multipart_chunksize,
+            extra_args=extra_args,
+        )
+        await self._write_chunks(chunks, dest, TransferMeter("download"), s3url)
+
+    @staticmethod
+    async def _write_chunks(
+        chunks: AsyncIterator[bytes], dest: str | Path | IOBase | BinaryIO, meter: TransferMeter, s3url: S3Dest
+    ) -> None:
+        """Write chunks to a path, removed on failure, or to a (sync or async) file object."""
+        if isinstance(dest, str | Path):
+            try:
+                async with aiofiles.open(dest, "wb") as fopen:
+                    async for chunk in chunks:
+                        await fopen.write(chunk)
+                        meter(len(chunk))
+            except BaseException:
+                Path(dest).unlink(missing_ok=True)
+                raise
+        else:
+            async for chunk in chunks:
+                ret = dest.write(chunk)
+                if inspect.isawaitable(ret):
+                    await ret
+                meter(len(chunk))
+        meter.log(s3url.url)
+
+    async def _content_encoding(self, s3url: S3Dest, extra_args: dict[str, Any] | None = None) -> Encoding | None:
+        client = await self.client()
+        head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key, **(extra_args or {}))
+        return encoding_of(head.get("ContentEncoding"))
+
+    async def _download_cached(
+        self, s3url: S3Dest, dest: str | Path | IOBase | BinaryIO, transfer: S3TransferConfigSchema | None
+    ) -> str | IOBase | BinaryIO:
+        assert self.cache is not None
+        client = await self.client()
+        head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key)
+        etag = head["ETag"]
+        key = f"s3://{s3url.bucket}/{s3url.key}"
+        entry = self.cache.lookup(key, etag=etag)
+        if entry is None:
+            if head["ContentLength"] > self.cache.max_bytes:
+                await self._download(s3url, dest, transfer, {"IfMatch": etag})
+                return dest
+            tmp = self.cache.tempfile()
+            try:
+                # IfMatch guarantees the cached content is the one the ETag was read from
+                await self._download(s3url, tmp, transfer, {"IfMatch": etag})
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            entry = self.cache.commit(key, tmp, {"etag": etag})
+        else:
+            logger.info("download cache hit uri='%s' etag=%s", s3url.url, etag)
+        await self.cache.materialize(entry, dest)
         return dest
 
     @make_sync
@@ -157,21 +650,311 @@ class S3Client:
         dest_bucket: str,
         dest_prefix: str = "",
         name_only: bool = False,
+        transfer: S3TransferConfigSchema | None = None,
     ) -> tuple[S3Dest, S3Dest]:
-        copy_source = {
-            "Bucket": src_bucket,
-            "Key": src_path,
-        }
+        """
+        Server-side copy of one object.
 
+        Objects below `multipart_threshold` use a single CopyObject. Larger objects are copied with
+        UploadPartCopy requests of `multipart_chunksize` bytes, `max_concurrency` at a time.
+        """
         if not name_only:
             dest_path = f"{dest_prefix}{src_path}"
         else:
             dest_path = f"{dest_prefix}{Path(src_path).name}"
 
-        async with self.session.client("s3", **self._boto_client_args(self.options)) as client:
-            await client.copy(copy_source, dest_bucket, dest_path)
+        meter = TransferMeter("copy")
+        with self._observe("copy", dest_bucket):
+            await self._copy_object(
+                src_bucket, src_path, dest_bucket, dest_path, transfer=transfer or self.options.transfer, meter=meter
+            )
+        self._count_bytes("copy", dest_bucket, meter.bytes)
+        meter.log(f"s3://{dest_bucket}/{dest_path}")
 
         return (
             S3URL(bucket=src_bucket, key=src_path, region=self.options.region).to_model(),
             S3URL(bucket=dest_bucket, key=dest_path, region=self.options.region).to_model(),
         )
+
+    async def _list_pages(
+        self, bucket: str, prefix: str, delimiter: str = "", page_size: int = 1000
+    ) -> AsyncIterator[dict[str, Any]]:
+        client = await self.client()
+        kwargs: dict[str, Any] = {"Bucket": bucket, "Prefix": prefix, "PaginationConfig": {"PageSize": page_size}}
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+        pages = aiter(client.get_paginator("list_objects_v2").paginate(**kwargs))
+        while True:
+            # Each page request is observed on its own, not the time the consumer spends between pages
+            with self._observe("list", bucket):
+                page = await anext(pages, None)
+            if page is None:
+                return
+            yield page
+
+    async def list_objects(
+        self,
+        prefix: str | None = None,
+        bucket: str = "",
+        *,
+        page_size: int = 1000,
+        concurrency: int = 1,
+        shard_delimiter: str = "/",
+    ) -> AsyncIterator[S3Dest]:
+        """
+        Lazily list every object under a prefix, one ListObjectsV2 page at a time.
+
+        Args:
+            prefix: Key prefix to list, defaults to the client prefix.
+            bucket: Bucket to list, defaults to the client bucket.
+            page_size: Keys requested per page.
+            concurrency: When greater than 1, the common prefixes found at the first `shard_delimiter`
+                level are listed in parallel by that many workers. Keys are then yielded in no particular order.
+            shard_delimiter: Delimiter used to split the listing into shards.
+
+        Yields:
+            An S3Dest per object. Memory stays bounded by a few pages whatever the number of keys.
+        """
+        if prefix is None:
+            prefix = self.prefix
+        bucket = bucket or self.bucket
+        if concurrency <= 1:
+            async for page in self._list_pages(bucket, prefix, page_size=page_size):
+                for obj in page.get("Contents", []):
+                    yield S3URL(bucket=bucket, key=obj["Key"], region=self.options.region).to_model()
+            return
+
+        results: asyncio.Queue[Any] = asyncio.Queue(maxsize=page_size)
+        shards: asyncio.Queue[str | None] = asyncio.Queue(maxsize=concurrency)
+
+        async def put_page(page: dict[str, Any]) -> None:
+            for obj in page.get("Contents", []):
+                await results.put(S3URL(bucket=bucket, key=obj["Key"], region=self.options.region).to_model())
+
+        async def discover() -> None:
+            async for page in self._list_pages(bucket, prefix, delimiter=shard_delimiter, page_size=page_size):
+                await put_page(page)
+                for common in page.get("CommonPrefixes", []):
+                    await shards.put(common["Prefix"])
+            for _ in range(concurrency):
+                await shards.put(None)
+
+        async def worker() -> None:
+            while (shard := await shards.get()) is not None:
+                async for page in self._list_pages(bucket, shard, page_size=page_size):
+                    await put_page(page)
+
+        async def run() -> None:
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(discover())
+                    for _ in range(concurrency):
+                        tg.create_task(worker())
+            except ExceptionGroup as eg:
+                await results.put(eg.exceptions[0])  # pylint: disable=unsubscriptable-object
+                return
+            await results.put(_DONE)
+
+        task = asyncio.create_task(run())
+        try:
+            while (item := await results.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    @staticmethod
+    def _byte_range(offset: int, length: int | None) -> str:
+        if length is None:
+            return f"bytes={offset}-"
+        return f"bytes={offset}-{offset + length - 1}"
+
+    async def _get_object(self, **kwargs: Any) -> dict[str, Any]:
+        """
+        GetObject, hedged when enabled: a second request is sent if the first has not responded
+        within the configured percentile of recent GET latencies, and the first response wins.
+        """
+        client = await self.client()
+        if not self.options.hedge.enabled:
+            return await client.get_object(**kwargs)
+
+        def on_hedge() -> None:
+            logger.debug("hedging GET s3://%s/%s", kwargs["Bucket"], kwargs["Key"])
+            if self.metrics is not None:
+                self.metrics.add_hedge(kwargs["Bucket"])
+
+        return await hedged(
+            self._get_latency.timed(lambda: client.get_object(**kwargs)),
+            self._get_latency.deadline(),
+            discard=lambda resp: resp["Body"].close(),
+            on_hedge=on_hedge,
+        )
+
+    async def _get_range(
+        self,
+        s3url: S3Dest,
+        offset: int,
+        length: int | None,
+        chunk_size: int,
+        extra_args: dict[str, Any] | None = None,
+    ) -> AsyncIterator[bytes]:
+        if length == 0:
+            # An empty Range header is invalid and ignored by S3: it would return the whole object
+            return
+        kwargs: dict[str, Any] = {"Bucket": s3url.bucket, "Key": s3url.key, **(extra_args or {})}
+        if offset or length is not None:
+            kwargs["Range"] = self._byte_range(offset, length)
+        with self._observe("download", s3url.bucket):
+            resp = await self._get_object(**kwargs)
+        body = resp["Body"]
+        try:
+            while chunk := await body.read(chunk_size):
+                self._count_bytes("download", s3url.bucket, len(chunk))
+                yield chunk
+        finally:
+            body.close()
+
+    async def _read_range(
+        self,
+        s3url: S3Dest,
+        offset: int,
+        length: int,
+        chunk_size: int,
+        extra_args: dict[str, Any] | None = None,
+    ) -> bytes:
+        return b"".join([chunk async for chunk in self._get_range(s3url, offset, length, chunk_size, extra_args)])
+
+    async def stream_object(
+        self,
+        s3url: S3Dest,
+        chunk_size: int = 1024 * 1024,
+        *,
+        offset: int = 0,
+        length: int | None = None,
+        concurrency: int = 1,
+        transfer: S3TransferConfigSchema | None = None,
+        extra_args: dict[str, Any] | None = None,
+        decode: bool = False,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream an object's body in chunks without buffering it.
+
+        Args:
+            s3url: Object to read.
+            chunk_size: Maximum size of each yielded chunk.
+            offset: First byte to read.
+            length: Number of bytes to read, up to the end of the object if None.
+            concurrency: When greater than 1, the range is split into `multipart_chunksize` parts fetched
+                concurrently and yielded in order. Memory is bounded by part size times concurrency.
+            transfer: Per-call transfer settings override.
+            extra_args: Extra GetObject arguments, e.g. IfMatch to pin the object version.
+            decode: Decompress objects stored with a gzip or zstd Content-Encoding, found with a HEAD request.
+                Only whole objects can be decoded, not ranges.
+
+        Yields:
+            The object bytes, in order, in chunks of at most `chunk_size`.
+
+        Raises:
+            ValueError: `offset` or `length` is negative.
+        """
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError(f"invalid range offset={offset} length={length}")
+        part_size = (transfer or self.options.transfer).multipart_chunksize
+        encoding: Encoding | None = None
+        if decode:
+            if offset or length is not None:
+                raise ValueError("decode is not supported for a range of an object")
+            encoding = await self._content_encoding(s3url, extra_args)
+        chunks = self._stream(
+            s3url,
+            chunk_size,
+            offset=offset,
+            length=length,
+            concurrency=concurrency,
+            part_size=part_size,
+            extra_args=extra_args,
+        )
+        if encoding is None:
+            async for chunk in chunks:
+                yield chunk
+            return
+        async for data in decompress_stream(chunks, encoding):
+            # Decompressed data outgrows the compressed chunks, it is split back to chunk_size
+            with memoryview(data) as view:
+                for i in range(0, len(view), chunk_size):
+                    yield bytes(view[i : i + chunk_size])
+
+    async def _stream(
+        self,
+        s3url: S3Dest,
+        chunk_size: int,
+        *,
+        offset: int = 0,
+        length: int | None = None,
+        concurrency: int = 1,
+        part_size: int,
+        extra_args: dict[str, Any] | None = None,
+    ) -> AsyncIterator[bytes]:
+        if concurrency <= 1:
+            async for chunk in self._get_range(s3url, offset, length, chunk_size, extra_args):
+                yield chunk
+            return
+
+        if length is None:
+            client = await self.client()
+            head = await client.head_object(Bucket=s3url.bucket, Key=s3url.key, **(extra_args or {}))
+            length = max(0, head["ContentLength"] - offset)
+        end = offset + length
+        starts = iter(range(offset, end, part_size))
+        inflight: deque[asyncio.Task[bytes]] = deque()
+
+        def schedule() -> None:
+            for start in starts:
+                part = self._read_range(s3url, start, min(part_size, end - start), chunk_size, extra_args)
+                inflight.append(asyncio.create_task(part))
+                if len(inflight) >= concurrency:
+                    return
+
+        try:
+            schedule()
+            while inflight:
+                data = await inflight.popleft()
+                schedule()
+                view = memoryview(data)
+                for i in range(0, len(view), chunk_size):
+                    yield bytes(view[i : i + chunk_size])
+        finally:
+            for task in inflight:
+                task.cancel()
+
+    async def presign(
+        self, s3url: S3Dest, method: Literal["GET", "PUT"] = "GET", expires_in: int | None = None
+    ) -> PresignedURL:
+        """
+        Generate a presigned GET or PUT URL for an object.
+
+        A URL signed earlier for the same object, method and validity is reused while
+        more than half of its validity remains, so hot keys are not re-signed on every call.
+        """
+        if expires_in is None:
+            expires_in = self.options.presign_expires_in
+        cache_key = (s3url.bucket, s3url.key, method, expires_in)
+        if self._presigned is not None and (cached := self._presigned.get(cache_key)) is not None:
+            return cached
+        client = await self.client()
+        operation = "get_object" if method == "GET" else "put_object"
+        url = await client.generate_presigned_url(
+            operation, Params={"Bucket": s3url.bucket, "Key": s3url.key}, ExpiresIn=expires_in
+        )
+        presigned = PresignedURL(
+            url=url,
+            method=method,
+            expires_at=datetime.now(UTC) + timedelta(seconds=expires_in),
+            dest=S3URL(bucket=s3url.bucket, key=s3url.key, region=self.options.region).to_model(),
+        )
+        if self._presigned is not None:
+            self._presigned[cache_key] = presigned
+        return presigned
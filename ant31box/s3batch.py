@@ -0,0 +1,355 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+from contextlib import AbstractContextManager
+from io import IOBase
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from ant31box.asyncutils import aiterate
+from ant31box.config import S3ConfigSchema, S3TransferConfigSchema
+from ant31box.models import DeleteResult, S3Dest, TransferResult
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Maximum number of keys accepted by a single DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+MAX_PARTS = 10000
+MAX_COPY_OBJECT_SIZE = 5 * 1024**3
+
+type ProgressCallback = Callable[[TransferResult], Awaitable[Any] | Any]
+
+
+class TransferMeter:
+    """
+    Transfer callback measuring bytes and throughput.
+
+    aioboto3 reports per-part increments on uploads but running totals on downloads and copies,
+    hence the `cumulative` switch.
+    """
+
+    def __init__(self, operation: str, cumulative: bool = False):
+        self.operation = operation
+        self.cumulative = cumulative
+        self.bytes: int = 0
+        self.start: float = time.perf_counter()
+
+    def __call__(self, value: int) -> None:
+        if self.cumulative:
+            self.bytes = max(self.bytes, value)
+        else:
+            self.bytes += value
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second since the meter was created."""
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def log(self, url: str) -> None:
+        logger.info(
+            "%s done url='%s' bytes=%d elapsed=%.3fs throughput=%.2fMiB/s",
+            self.operation,
+            url,
+            self.bytes,
+            self.elapsed,
+            self.throughput / (1024 * 1024),
+        )
+
+
+class S3BatchMixin:
+    """
+    Batch transfers, multipart server-side copies and batched deletes of S3Client.
+
+    Batches run the single-object operations of S3Client over its pooled client, at most `concurrency` at a time.
+    """
+
+    # Provided by S3Client
+    options: S3ConfigSchema
+    bucket: str
+    client: Callable[..., Awaitable[Any]]
+    _observe: Callable[..., AbstractContextManager[None]]
+    list_objects: Callable[..., AsyncIterator[S3Dest]]
+    upload_file_async: Callable[..., Awaitable[S3Dest]]
+    download_file_async: Callable[..., Awaitable[str | IOBase | BinaryIO]]
+    copy_s3_to_s3_async: Callable[..., Awaitable[tuple[S3Dest, S3Dest]]]
+
+    async def _copy_object(
+        self,
+        src_bucket: str,
+        src_key: str,
+        dest_bucket: str,
+        dest_key: str,
+        *,
+        transfer: S3TransferConfigSchema,
+        meter: TransferMeter,
+    ) -> None:
+        client = await self.client()
+        copy_source = {"Bucket": src_bucket, "Key": src_key}
+        head = await client.head_object(Bucket=src_bucket, Key=src_key)
+        size = head["ContentLength"]
+        if size < min(transfer.multipart_threshold, MAX_COPY_OBJECT_SIZE):
+            await client.copy_object(CopySource=copy_source, Bucket=dest_bucket, Key=dest_key)
+            meter(size)
+            return
+
+        # S3 caps multipart uploads at 10000 parts: grow the part size for very large objects
+        part_size = max(transfer.multipart_chunksize, -(-size // MAX_PARTS))
+        # CopyObject preserves these headers by itself, a multipart upload has to be told
+        create_args = {k: head[k] for k in ("ContentType", "ContentEncoding", "Metadata") if head.get(k)}
+        mpu = await client.create_multipart_upload(Bucket=dest_bucket, Key=dest_key, **create_args)
+        upload_id = mpu["UploadId"]
+        parts = iter(enumerate(range(0, size, part_size), start=1))
+        etags: dict[int, str] = {}
+
+        async def worker() -> None:
+            for number, start in parts:
+                end = min(start + part_size, size) - 1
+                resp = await client.upload_part_copy(
+                    Bucket=dest_bucket,
+                    Key=dest_key,
+                    CopySource=copy_source,
+                    CopySourceRange=f"bytes={start}-{end}",
+                    PartNumber=number,
+                    UploadId=upload_id,
+                )
+                etags[number] = resp["CopyPartResult"]["ETag"]
+                meter(end - start + 1)
+
+        try:
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    for _ in range(max(1, transfer.max_concurrency)):
+                        tg.create_task(worker())
+            except ExceptionGroup as eg:
+                # Fail with the error of the part, as a CopyObject would
+                raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+            await client.complete_multipart_upload(
+                Bucket=dest_bucket,
+                Key=dest_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": n, "ETag": etags[n]} for n in sorted(etags)]},
+            )
+        except BaseException:
+            await client.abort_multipart_upload(Bucket=dest_bucket, Key=dest_key, UploadId=upload_id)
+            raise
+
+    async def copy_prefix_async(
+        self,
+        *,
+        src_bucket: str,
+        src_prefix: str,
+        dest_bucket: str,
+        dest_prefix: str = "",
+        name_only: bool = False,
+        concurrency: int | None = None,
+        progress: ProgressCallback | None = None,
+        transfer: S3TransferConfigSchema | None = None,
+    ) -> list[TransferResult]:
+        """
+        Copy every object under `src_prefix`, streaming the source listing into concurrent copies.
+
+        Destination keys follow `copy_s3_to_s3_async`: `dest_prefix` + source key, or
+        `dest_prefix` + file name when `name_only` is set.
+
+        Returns:
+            One TransferResult per source key, holding the (source, dest) S3Dest pair or the error.
+        """
+
+        async def copy(source: S3Dest, _: str) -> tuple[S3Dest, S3Dest]:
+            return await self.copy_s3_to_s3_async(
+                src_bucket=source.bucket,
+                src_path=source.key,
+                dest_bucket=dest_bucket,
+                dest_prefix=dest_prefix,
+                name_only=name_only,
+                transfer=transfer,
+            )
+
+        dest_url = f"s3://{dest_bucket}/{dest_prefix}"
+        items = ((obj, dest_url) async for obj in self.list_objects(src_prefix, src_bucket))
+        return await self._run_batch(items, copy, concurrency, progress)
+
+    async def _run_batch(
+        self,
+        items: Iterable[tuple[Any, Any]] | AsyncIterable[tuple[Any, Any]],
+        operation: Callable[[Any, Any], Awaitable[Any]],
+        concurrency: int | None,
+        progress: ProgressCallback | None,
+    ) -> list[TransferResult]:
+        """
+        Run `operation(source, dest)` for every item with at most `concurrency` in flight.
+
+        Items are pulled lazily so large iterables are never materialized as tasks.
+        Failures are captured per item and never abort the batch. Results keep the input order.
+        """
+        concurrency = max(1, concurrency or self.options.max_pool_connections)
+        await self.client()
+        pending: asyncio.Queue[tuple[int, Any, Any] | None] = asyncio.Queue(maxsize=concurrency)
+        results: dict[int, TransferResult] = {}
+
+        async def produce() -> None:
+            index = 0
+            async for source, dest in aiterate(items):
+                await pending.put((index, source, dest))
+                index += 1
+            for _ in range(concurrency):
+                await pending.put(None)
+
+        async def worker() -> None:
+            while (item := await pending.get()) is not None:
+                index, source, dest = item
+                try:
+                    res = TransferResult(source=source, dest=dest, result=await operation(source, dest))
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.warning("transfer failed source='%s' dest='%s': %s", source, dest, e)
+                    res = TransferResult(source=source, dest=dest, error=e)
+                results[index] = res
+                if progress is not None:
+                    ret = progress(res)
+                    if inspect.isawaitable(ret):
+                        await ret
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(produce())
+                for _ in range(concurrency):
+                    tg.create_task(worker())
+        except ExceptionGroup as eg:
+            # The items source failed (e.g. listing a missing bucket): its error, not a group
+            raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+        return [results[i] for i in range(len(results))]
+
+    async def upload_many(
+        self,
+        items: Iterable[tuple[str | IOBase | BinaryIO, str]],
+        concurrency: int | None = None,
+        progress: ProgressCallback | None = None,
+        transfer: S3TransferConfigSchema | None = None,
+    ) -> list[TransferResult]:
+        """
+        Upload many (source, dest) pairs over the shared client.
+
+        Args:
+            items: Pairs of local path or file object and destination key, as for `upload_file_async`.
+            concurrency: Maximum concurrent uploads, defaults to `max_pool_connections`.
+            progress: Called with each TransferResult as soon as its item finishes.
+            transfer: Per-call transfer settings override.
+
+        Returns:
+            One TransferResult per item, in input order, holding the S3Dest or the error.
+        """
+
+        async def upload(source: str | IOBase | BinaryIO, dest: str) -> S3Dest:
+            return await self.upload_file_async(source, dest, transfer=transfer)
+
+        return await self._run_batch(items, upload, concurrency, progress)
+
+    async def download_many(
+        self,
+        items: Iterable[tuple[S3Dest, str | Path | IOBase | BinaryIO]],
+        concurrency: int | None = None,
+        progress: ProgressCallback | None = None,
+        transfer: S3TransferConfigSchema | None = None,
+    ) -> list[TransferResult]:
+        """
+        Download many (S3Dest, dest) pairs over the shared client.
+
+        Args:
+            items: Pairs of source object and local path or file object, as for `download_file_async`.
+            concurrency: Maximum concurrent downloads, defaults to `max_pool_connections`.
+            progress: Called with each TransferResult as soon as its item finishes.
+            transfer: Per-call transfer settings override.
+
+        Returns:
+            One TransferResult per item, in input order, holding the destination or the error.
+        """
+
+        async def download(source: S3Dest, dest: str | Path | IOBase | BinaryIO) -> str | IOBase | BinaryIO:
+            return await self.download_file_async(source, dest, transfer=transfer)
+
+        return await self._run_batch(items, download, concurrency, progress)
+
+    async def _delete_batch(self, bucket: str, keys: list[str], result: DeleteResult) -> None:
+        client = await self.client()
+        try:
+            with self._observe("delete", bucket):
+                resp = await client.delete_objects(
+                    Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+                )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("delete batch failed bucket='%s' keys=%d: %s", bucket, len(keys), e)
+            result.errors.update(dict.fromkeys(keys, str(e)))
+            return
+        errors = resp.get("Errors", [])
+        for error in errors:
+            result.errors[error["Key"]] = f"{error.get('Code', '')}: {error.get('Message', '')}"
+        result.deleted += len(keys) - len(errors)
+
+    async def delete_many(
+        self,
+        keys: Iterable[str] | AsyncIterable[str],
+        bucket: str = "",
+        concurrency: int | None = None,
+    ) -> DeleteResult:
+        """
+        Delete keys in DeleteObjects batches of up to 1000 keys, running batches concurrently.
+
+        Args:
+            keys: Keys to delete, consumed lazily.
+            bucket: Bucket holding the keys, defaults to the client bucket.
+            concurrency: Maximum batches in flight, defaults to `max_pool_connections`.
+
+        Returns:
+            A DeleteResult with the number of deleted keys and the error of every key that was not deleted.
+        """
+        bucket = bucket or self.bucket
+        concurrency = max(1, concurrency or self.options.max_pool_connections)
+        result = DeleteResult()
+        batches: asyncio.Queue[list[str] | None] = asyncio.Queue(maxsize=concurrency)
+
+        async def produce() -> None:
+            batch: list[str] = []
+            async for key in aiterate(keys):
+                batch.append(key)
+                if len(batch) == DELETE_BATCH_SIZE:
+                    await batches.put(batch)
+                    batch = []
+            if batch:
+                await batches.put(batch)
+            for _ in range(concurrency):
+                await batches.put(None)
+
+        async def worker() -> None:
+            while (batch := await batches.get()) is not None:
+                await self._delete_batch(bucket, batch, result)
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(produce())
+                for _ in range(concurrency):
+                    tg.create_task(worker())
+        except ExceptionGroup as eg:
+            # e.g. the listing of a missing bucket: ClientError, not a group
+            raise eg.exceptions[0] from None  # pylint: disable=unsubscriptable-object
+        logger.info("deleted bucket='%s' keys=%d errors=%d", bucket, result.deleted, len(result.errors))
+        return result
+
+    async def purge_prefix(self, prefix: str, bucket: str = "", concurrency: int | None = None) -> DeleteResult:
+        """
+        Delete every object under `prefix`, streaming the listing into batched deletes.
+
+        Raises:
+            ValueError: If `prefix` is empty, to avoid wiping a whole bucket by mistake.
+        """
+        if not prefix:
+            raise ValueError("purge_prefix requires a non-empty prefix")
+        bucket = bucket or self.bucket
+        keys = (obj.key async for obj in self.list_objects(prefix, bucket))
+        return await self.delete_many(keys, bucket, concurrency)
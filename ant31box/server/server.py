@@ -11,6 +11,7 @@ from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from ant31box.config import Config, FastAPIConfigSchema, config
 from ant31box.db import AchemyEngine, get_engine
 from ant31box.init import init_from_config
+from ant31box.s3 import close_clients as close_s3_clients
 
 from .middlewares.errors import catch_exceptions_middleware
 from .middlewares.process_time import add_process_time_header
@@ -20,26 +21,24 @@ from .middlewares.token import TokenAuthMiddleware
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Manage the database engine lifespan within the FastAPI application lifecycle.
+    Manage the database engine and S3 connection pools within the FastAPI application lifecycle.
     Initializes the engine on startup and disposes of it on shutdown.
-    This is only active if the 'achemy' package is installed.
+    The database engine is only active if the 'achemy' package is installed.
     """
-    if AchemyEngine is None:
-        # If achemy is not installed, do nothing.
+    engine = None
+    # If config is not in state, skip the engine to maintain compatibility
+    # with scenarios where lifespan is used without the full server setup.
+    if AchemyEngine is not None and hasattr(app.state, "config"):
+        engine = get_engine(app.state.config)
+        _, session_factory = engine.session()
+        app.state.engine = engine
+        app.state.session_factory = session_factory
+    try:
         yield
-        return
-    if not hasattr(app.state, "config"):
-        # If config is not in state, do nothing to maintain compatibility
-        # with scenarios where lifespan is used without the full server setup.
-        yield
-        return
-
-    engine = get_engine(app.state.config)
-    _, session_factory = engine.session()
-    app.state.engine = engine
-    app.state.session_factory = session_factory
-    yield
-    await engine.dispose_engines()
+    finally:
+        if engine is not None:
+            await engine.dispose_engines()
+        await close_s3_clients()
 
 
 def cors(server: "Server"):
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Bytes saved versus CPU spent by the streaming codecs, on generated JSON lines and CSV artifacts.
+
+    python benchmarks/codec_bench.py --size 67108864
+    python benchmarks/codec_bench.py --file artifact.json
+
+CPU time is the process time of the compressing/decompressing threads, throughput is relative to the
+uncompressed size.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from ant31box.codec import ENCODINGS, compress_stream, decompress_stream
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def json_lines(size: int) -> bytes:
+    rng = random.Random(0)
+    rows: list[bytes] = []
+    total = 0
+    while total < size:
+        row = json.dumps(
+            {"id": rng.randrange(10**9), "user": f"user-{rng.randrange(10**4)}", "score": rng.random(), "ok": True}
+        ).encode()
+        rows.append(row + b"\n")
+        total += len(row) + 1
+    return b"".join(rows)[:size]
+
+
+def csv_rows(size: int) -> bytes:
+    rng = random.Random(0)
+    rows = [b"timestamp,sensor,value\n"]
+    total = len(rows[0])
+    while total < size:
+        row = f"{1700000000 + len(rows)},sensor-{rng.randrange(64)},{rng.gauss(20, 5):.3f}\n".encode()
+        rows.append(row)
+        total += len(row)
+    return b"".join(rows)[:size]
+
+
+async def _consume(chunks) -> int:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def _chunks(data: bytes) -> list[bytes]:
+    return [data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+async def bench(name: str, data: bytes, levels: dict[str, list[int]]) -> None:
+    size = len(data)
+    print(f"{name}: {size / 2**20:.1f}MiB")
+    for encoding in ENCODINGS:
+        for level in levels[encoding]:
+            cpu, start = time.process_time(), time.perf_counter()
+            compressed = b"".join([chunk async for chunk in compress_stream(_chunks(data), encoding, level)])
+            c_cpu, c_wall = time.process_time() - cpu, time.perf_counter() - start
+
+            cpu, start = time.process_time(), time.perf_counter()
+            assert await _consume(decompress_stream(_chunks(compressed), encoding)) == size
+            d_cpu, d_wall = time.process_time() - cpu, time.perf_counter() - start
+
+            saved = size - len(compressed)
+            print(
+                f"  {encoding:<5} level={level:>2} ratio={size / len(compressed):6.2f} "
+                f"saved={saved / 2**20:8.1f}MiB ({saved / size:6.1%}) "
+                f"compress={c_cpu:6.2f}s cpu {size / c_wall / 2**20:7.1f}MiB/s "
+                f"decompress={d_cpu:6.2f}s cpu {size / d_wall / 2**20:7.1f}MiB/s "
+                f"saved/cpu={saved / 2**20 / max(c_cpu, 1e-9):8.1f}MiB/s"
+            )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--file", help="Benchmark this file instead of the generated artifacts")
+    args = parser.parse_args()
+
+    levels = {"gzip": [1, 6, 9], "zstd": [1, 3, 9, 19]}
+    if args.file:
+        with open(args.file, "rb") as fopen:
+            await bench(args.file, fopen.read(), levels)
+        return
+    await bench("json lines", json_lines(args.size), levels)
+    await bench("csv", csv_rows(args.size), levels)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
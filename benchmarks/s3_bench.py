@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for S3Client.
+
+Run against any S3-compatible endpoint, e.g. a local moto server:
+
+    moto_server -p 5000 &
+    python benchmarks/s3_bench.py --endpoint http://127.0.0.1:5000 overhead
+    python benchmarks/s3_bench.py --endpoint http://127.0.0.1:5000 --size 268435456 throughput
+"""
+
+import argparse
+import asyncio
+import time
+from io import BytesIO
+
+from ant31box.config import S3ConfigSchema, S3TransferConfigSchema
+from ant31box.s3 import S3Client, TransferMeter
+
+
+def _report(name: str, count: int, elapsed: float) -> None:
+    print(f"{name:<24} {count:>6} objects {elapsed:8.3f}s {elapsed / count * 1000:8.2f} ms/object")
+
+
+async def bench_overhead(client: S3Client, count: int, size: int) -> None:
+    """Per-object overhead of a fresh client per call versus the pooled client."""
+    payload = b"x" * size
+
+    start = time.perf_counter()
+    for i in range(count):
+        async with client.session.client("s3", **client._boto_client_args(client.options)) as s3:
+            await s3.upload_fileobj(BytesIO(payload), client.bucket, f"bench/fresh/{i}")
+    _report("fresh client per call", count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(count):
+        await client.upload_file_async(BytesIO(payload), f"bench/pooled/{i}")
+    _report("pooled client", count, time.perf_counter() - start)
+
+
+async def bench_batch(client: S3Client, count: int, size: int) -> None:
+    """Small-object uploads one at a time versus upload_many."""
+    payload = b"x" * size
+
+    start = time.perf_counter()
+    for i in range(count):
+        await client.upload_file_async(BytesIO(payload), f"bench/serial/{i}")
+    _report("serial upload_file_async", count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await client.upload_many((BytesIO(payload), f"bench/batch/{i}") for i in range(count))
+    _report("upload_many", count, time.perf_counter() - start)
+
+
+async def bench_throughput(client: S3Client, size: int) -> None:
+    """Upload and download throughput of one large object for a grid of transfer settings."""
+    payload = b"x" * size
+    for chunksize_mib in (8, 16, 64):
+        for concurrency in (4, 10, 32):
+            transfer = S3TransferConfigSchema(
+                multipart_threshold=8 * 1024 * 1024,
+                multipart_chunksize=chunksize_mib * 1024 * 1024,
+                max_concurrency=concurrency,
+            )
+            up = TransferMeter("upload")
+            dest = await client.upload_file_async(BytesIO(payload), "bench/throughput", transfer=transfer)
+            up(size)
+            down = TransferMeter("download")
+            await client.download_file_async(dest, BytesIO(), transfer=transfer)
+            down(size)
+            print(
+                f"part={chunksize_mib:>3}MiB concurrency={concurrency:>3} "
+                f"upload={up.throughput / 2**20:8.1f}MiB/s download={down.throughput / 2**20:8.1f}MiB/s"
+            )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default="http://127.0.0.1:5000")
+    parser.add_argument("--bucket", default="bench")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("bench", choices=["overhead", "throughput", "batch"])
+    args = parser.parse_args()
+
+    options = S3ConfigSchema(
+        endpoint=args.endpoint, bucket=args.bucket, access_key="a", secret_key="a", region="us-east-1"
+    )
+    async with S3Client(options) as client:
+        s3 = await client.client()
+        await s3.create_bucket(Bucket=args.bucket)
+        if args.bench == "overhead":
+            await bench_overhead(client, args.count, args.size)
+        elif args.bench == "throughput":
+            await bench_throughput(client, args.size)
+        elif args.bench == "batch":
+            await bench_batch(client, args.count, args.size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
+import asyncio
+import hashlib
+import os
+import shutil
+import tracemalloc
+from io import BytesIO
 from pathlib import Path
 from tempfile import NamedTemporaryFile, TemporaryFile, mkdtemp
 
 import aiohttp
 import pytest
+import zstandard
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
-from ant31box.client.filedl import DownloadClient, FileInfo
-from ant31box.config import S3ConfigSchema
+from ant31box.client.filedl import DownloadClient, FileInfo, PartialDownload, PartialState
+from ant31box.config import DiskCacheConfigSchema, DownloadConfigSchema, S3ConfigSchema
 
 
 @pytest.mark.asyncio
@@ -160,6 +169,17 @@ async def test_filedl_file_scheme():
         assert resp.content is None
 
 
+@pytest.mark.asyncio
+async def test_filedl_file_scheme_same_file():
+    client = DownloadClient()
+    dir = mkdtemp()
+    path = Path(dir).joinpath("a.txt")
+    path.write_bytes(b"test")
+    with pytest.raises(shutil.SameFileError):
+        await client.download(source=f"file://{path}", dest_dir=dir)
+    assert path.read_bytes() == b"test"
+
+
 @pytest.mark.asyncio
 async def test_filedl_file_scheme_file_s3(aioboto3_s3_client):
     config = S3ConfigSchema(
@@ -213,3 +233,499 @@ async def test_filedl_file_scheme_output_s3(aioboto3_s3_client):
         assert resp.source == uri
         assert resp.path is None
         assert resp.content is not None
+
+
+LARGE_SIZE = 64 * 1024 * 1024
+
+
+async def _stream_large(request: web.Request) -> web.StreamResponse:
+    resp = web.StreamResponse(headers={"Content-Length": str(LARGE_SIZE)})
+    await resp.prepare(request)
+    chunk = b"x" * (1024 * 1024)
+    for _ in range(LARGE_SIZE // len(chunk)):
+        await resp.write(chunk)
+    await resp.write_eof()
+    return resp
+
+
+@pytest.fixture
+async def large_server():
+    app = web.Application()
+    app.router.add_get("/large.bin", _stream_large)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_streaming_memory(large_server):
+    client = DownloadClient(config=DownloadConfigSchema(chunk_size=256 * 1024))
+    url = str(large_server.make_url("/large.bin"))
+    dest = Path(mkdtemp()).joinpath("large.bin")
+    tracemalloc.start()
+    try:
+        resp = await client.download(source=url, output=str(dest))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert resp.path == str(dest)
+    assert dest.stat().st_size == LARGE_SIZE
+    # The body is never held in memory as a whole
+    assert peak < LARGE_SIZE // 8
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_streaming_error(large_server):
+    class FailingOutput(BytesIO):
+        def write(self, data):
+            if self.tell() > 1024 * 1024:
+                raise OSError("disk full")
+            return super().write(data)
+
+    client = DownloadClient()
+    url = str(large_server.make_url("/large.bin"))
+    with pytest.raises(OSError, match="disk full"):
+        await client.download(source=url, output=FailingOutput())
+    # The failed response went back to the pool: the next download works on the same session
+    with TemporaryFile() as tmp:
+        await client.download(source=url, output=tmp)
+        assert tmp.tell() == LARGE_SIZE
+    await client.session.close()
+
+
+@pytest.fixture
+async def range_server():
+    payload = os.urandom(5 * 1024 * 1024 + 123)
+    source = Path(mkdtemp()).joinpath("ranged.bin")
+    source.write_bytes(payload)
+    ranges: list[str] = []
+
+    async def ranged(request: web.Request) -> web.StreamResponse:
+        ranges.append(request.headers.get("Range", ""))
+        return web.FileResponse(source)
+
+    async def plain(request: web.Request) -> web.StreamResponse:
+        ranges.append(request.headers.get("Range", ""))
+        return web.Response(body=payload)
+
+    async def flaky(request: web.Request) -> web.StreamResponse:
+        ranges.append(request.headers.get("Range", ""))
+        if not request.headers.get("Range", "").startswith("bytes=0-"):
+            raise web.HTTPServiceUnavailable()
+        return web.FileResponse(source)
+
+    app = web.Application()
+    app.router.add_get("/ranged.bin", ranged)
+    app.router.add_get("/plain.bin", plain)
+    app.router.add_get("/flaky.bin", flaky)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, payload, ranges
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_ranged(range_server):
+    server, payload, ranges = range_server
+    part = 1024 * 1024
+    client = DownloadClient(config=DownloadConfigSchema(connections=4, part_size=part, chunk_size=64 * 1024))
+    dest = Path(mkdtemp()).joinpath("ranged.bin")
+    resp = await client.download(source=str(server.make_url("/ranged.bin")), output=str(dest))
+    assert resp.path == str(dest)
+    assert dest.read_bytes() == payload
+    assert len(ranges) == 6
+    assert ranges[0] == f"bytes=0-{part - 1}"
+    assert f"bytes={5 * part}-{len(payload) - 1}" in ranges
+
+    # Servers ignoring ranges are streamed in one response
+    ranges.clear()
+    dest = Path(mkdtemp()).joinpath("plain.bin")
+    await client.download(source=str(server.make_url("/plain.bin")), output=str(dest))
+    assert dest.read_bytes() == payload
+    assert len(ranges) == 1
+
+    # File objects are always streamed in one response
+    ranges.clear()
+    buf = BytesIO()
+    await client.download(source=str(server.make_url("/ranged.bin")), output=buf)
+    assert buf.getvalue() == payload
+    assert ranges == [""]
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_ranged_error(range_server):
+    server, _, _ = range_server
+    client = DownloadClient(config=DownloadConfigSchema(connections=4, part_size=1024 * 1024))
+    dest = Path(mkdtemp()).joinpath("flaky.bin")
+    # A failing range raises the same error as a failing single-stream download
+    with pytest.raises(aiohttp.ClientResponseError) as exc:
+        await client.download(source=str(server.make_url("/flaky.bin")), output=str(dest))
+    assert exc.value.status == 503
+    assert not dest.exists()
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_resume(range_server):
+    server, payload, ranges = range_server
+    url = str(server.make_url("/ranged.bin"))
+    client = DownloadClient(config=DownloadConfigSchema(resume=True))
+    async with client.session.head(url) as resp:
+        etag = resp.headers["ETag"]
+
+    # A previous attempt stopped after 1 MiB
+    dest = Path(mkdtemp()).joinpath("ranged.bin")
+    partial = PartialDownload(dest, url)
+    partial.part.write_bytes(payload[: 1024 * 1024])
+    partial.sidecar.write_text(PartialState(source=url, validator=etag).model_dump_json())
+    ranges.clear()
+    resp = await client.download(source=url, output=str(dest))
+    assert resp.path == str(dest)
+    assert dest.read_bytes() == payload
+    assert ranges == [f"bytes={1024 * 1024}-"]
+    assert not partial.part.exists()
+    assert not partial.sidecar.exists()
+
+    # The source changed since: the download starts over
+    partial.part.write_bytes(b"stale content")
+    partial.sidecar.write_text(PartialState(source=url, validator='"old-etag"').model_dump_json())
+    await client.download(source=url, output=str(dest))
+    assert dest.read_bytes() == payload
+    assert not partial.part.exists()
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_s3_resume(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = DownloadClient(s3_config=config, config=DownloadConfigSchema(resume=True))
+    await aioboto3_s3_client.create_bucket(Bucket=client.s3.bucket)
+    payload = os.urandom(300 * 1024)
+    await aioboto3_s3_client.put_object(Bucket=client.s3.bucket, Key="resume/a.bin", Body=payload)
+    head = await aioboto3_s3_client.head_object(Bucket=client.s3.bucket, Key="resume/a.bin")
+    uri = f"s3://{client.s3.bucket}/resume/a.bin"
+
+    dest = Path(mkdtemp()).joinpath("a.bin")
+    partial = PartialDownload(dest, uri)
+    partial.part.write_bytes(payload[:1000])
+    partial.sidecar.write_text(PartialState(source=uri, validator=head["ETag"]).model_dump_json())
+    resp = await client.download(source=uri, output=str(dest))
+    assert resp.path == str(dest)
+    assert dest.read_bytes() == payload
+    assert not partial.sidecar.exists()
+
+    partial.part.write_bytes(b"x" * 1000)
+    partial.sidecar.write_text(PartialState(source=uri, validator='"old-etag"').model_dump_json())
+    await client.download(source=uri, output=str(dest))
+    assert dest.read_bytes() == payload
+
+
+@pytest.mark.asyncio
+async def test_filedl_http_cache():
+    requests: list[tuple[str, str]] = []
+
+    async def handler(request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        requests.append((name, request.headers.get("If-None-Match", "")))
+        cache_control = {"fresh": "max-age=60", "stale": "max-age=0", "nostore": "no-store", "changed": "max-age=0"}
+        # "changed" gets a new version on every request: its revalidations never succeed
+        version = len(requests) if name == "changed" else 1
+        headers = {"ETag": f'"{name}-v{version}"', "Cache-Control": cache_control[name]}
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=f"content of {name}".encode(), headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/{name}.txt", handler)
+    server = TestServer(app)
+    await server.start_server()
+    cache = DiskCacheConfigSchema(enabled=True, path=mkdtemp(), max_bytes=1024 * 1024)
+    client = DownloadClient(config=DownloadConfigSchema(cache=cache))
+    try:
+        for name in ("fresh", "stale", "nostore", "changed"):
+            url = str(server.make_url(f"/{name}.txt"))
+            for _ in range(2):
+                buf = BytesIO()
+                resp = await client.download(source=url, output=buf)
+                assert buf.getvalue() == f"content of {name}".encode()
+                assert resp.filename == f"{name}.txt"
+            dest_dir = mkdtemp()
+            resp = await client.download(source=url, dest_dir=dest_dir)
+            assert Path(resp.path).read_bytes() == f"content of {name}".encode()
+    finally:
+        await server.close()
+        await client.session.close()
+
+    # Fresh entries skip the network, stale ones are revalidated, no-store ones are never cached
+    assert requests == [
+        ("fresh", ""),
+        ("stale", ""),
+        ("stale", '"stale-v1"'),
+        ("stale", '"stale-v1"'),
+        ("nostore", ""),
+        ("nostore", ""),
+        ("nostore", ""),
+        ("changed", ""),
+        ("changed", '"changed-v8"'),
+        ("changed", '"changed-v9"'),
+    ]
+    assert client.cache is not None
+    # Only fresh and revalidated entries are hits: a stale entry answered with a new version is a miss
+    assert client.cache.stats.hits == 4
+    assert client.cache.stats.misses == 8
+
+
+@pytest.mark.asyncio
+async def test_filedl_download_many():
+    inflight: dict[str, int] = {}
+    peaks: dict[str, int] = {}
+
+    async def handler(request: web.Request) -> web.Response:
+        host = request.host
+        inflight[host] = inflight.get(host, 0) + 1
+        peaks[host] = max(peaks.get(host, 0), inflight[host])
+        peaks["total"] = max(peaks.get("total", 0), sum(inflight.values()))
+        await asyncio.sleep(0.02)
+        inflight[host] -= 1
+        if request.match_info["name"] == "missing":
+            return web.Response(status=404)
+        return web.Response(body=request.match_info["name"].encode())
+
+    app = web.Application()
+    app.router.add_get("/{name}.txt", handler)
+    server = TestServer(app)
+    await server.start_server()
+    port = server.port
+    with NamedTemporaryFile() as tmp:
+        tmp.write(b"local")
+        tmp.flush()
+        sources: list = [f"http://127.0.0.1:{port}/a{i}.txt" for i in range(6)]
+        sources += [(f"http://localhost:{port}/b{i}.txt", BytesIO()) for i in range(6)]
+        sources += [f"http://127.0.0.1:{port}/missing.txt", tmp.name]
+        done = []
+        client = DownloadClient()
+        results = await client.download_many(
+            sources, dest_dir=mkdtemp(), concurrency=3, per_host=2, progress=done.append
+        )
+    await server.close()
+    await client.session.close()
+
+    assert len(results) == len(done) == 14
+    assert [res.source for res in results[:6]] == sources[:6]
+    assert Path(results[0].result.path).read_bytes() == b"a0"
+    assert results[6].result.content.getvalue() == b"b0"
+    assert isinstance(results[12].error, aiohttp.ClientResponseError)
+    assert results[13].ok
+    assert Path(results[13].result.path).read_bytes() == b"local"
+    assert sum(res.ok for res in results) == 13
+    assert peaks[f"127.0.0.1:{port}"] <= 2
+    assert peaks[f"localhost:{port}"] <= 2
+    assert peaks["total"] <= 3
+
+    async def failing_sources():
+        yield sources[0]
+        raise OSError("listing failed")
+
+    with pytest.raises(OSError, match="listing failed"):
+        await DownloadClient().download_many(failing_sources(), dest_dir=mkdtemp())
+
+
+@pytest.mark.asyncio
+async def test_filedl_content_addressed(aioboto3_s3_client, range_server, caplog):
+    server, payload, _ = range_server
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = DownloadClient(s3_config=config, config=DownloadConfigSchema(chunk_size=256 * 1024))
+    await aioboto3_s3_client.create_bucket(Bucket=client.s3.bucket)
+    store = Path(mkdtemp())
+    sha256 = hashlib.sha256(payload).hexdigest()
+
+    resp = await client.download_content_addressed(
+        str(server.make_url("/ranged.bin")), store, algorithms=["sha256", "md5"]
+    )
+    assert resp.path == store.joinpath(f"{sha256}.bin")
+    assert resp.path.read_bytes() == payload
+    assert resp.metadata == {
+        "sha256": sha256,
+        "md5": hashlib.md5(payload).hexdigest(),
+        "size": str(len(payload)),
+    }
+
+    # The same content from another scheme is not written again
+    with NamedTemporaryFile(suffix=".bin") as tmp:
+        tmp.write(payload)
+        tmp.flush()
+        mtime = resp.path.stat().st_mtime_ns
+        local = await client.download_content_addressed(tmp.name, store)
+        assert local.path == resp.path
+        assert local.metadata["sha256"] == sha256
+        assert resp.path.stat().st_mtime_ns == mtime
+        # S3 objects carrying their sha256 are not even transferred
+        dest = await client.s3.upload_file_async(tmp.name, "cas/a.bin", skip_unchanged=True)
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        remote = await client.download_content_addressed(dest.url, store)
+    assert remote.path == resp.path
+    assert "content already stored" in caplog.text
+    assert sorted(p.name for p in store.iterdir()) == [f"{sha256}.bin"]
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_transfer(aioboto3_s3_client, range_server):
+    server, payload, _ = range_server
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    config.transfer.multipart_chunksize = 5 * 1024 * 1024
+    client = DownloadClient(s3_config=config, config=DownloadConfigSchema(chunk_size=256 * 1024))
+    await aioboto3_s3_client.create_bucket(Bucket="mirror")
+    sha256 = hashlib.sha256(payload).hexdigest()
+
+    resp = await client.transfer(str(server.make_url("/ranged.bin")), "s3://mirror/http.bin", algorithms=["md5"])
+    assert resp.path is None
+    assert resp.metadata["key"] == "http.bin"
+    assert resp.metadata["size"] == str(len(payload))
+    assert resp.metadata["sha256"] == sha256
+    assert resp.metadata["md5"] == hashlib.md5(payload).hexdigest()
+    obj = await aioboto3_s3_client.get_object(Bucket="mirror", Key="http.bin")
+    assert await obj["Body"].read() == payload
+
+    # s3 to s3, then a local file
+    copy = await client.transfer("s3://mirror/http.bin", "s3://mirror/copy.bin")
+    assert copy.metadata["sha256"] == sha256
+    with NamedTemporaryFile(suffix=".bin") as tmp:
+        tmp.write(payload[:1024])
+        tmp.flush()
+        local = await client.transfer(tmp.name, "s3://mirror/local.bin")
+    assert local.metadata["size"] == "1024"
+    obj = await aioboto3_s3_client.get_object(Bucket="mirror", Key="local.bin")
+    assert await obj["Body"].read() == payload[:1024]
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_coalesce():
+    hits: list[str] = []
+    release = asyncio.Event()
+
+    async def handler(request: web.Request) -> web.Response:
+        hits.append(request.path)
+        await release.wait()
+        if request.path == "/broken.bin":
+            return web.Response(status=500)
+        return web.Response(body=b"popular asset")
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    client = DownloadClient(config=DownloadConfigSchema(coalesce=True))
+    url = str(server.make_url("/asset.bin"))
+    dest_dirs = [mkdtemp() for _ in range(5)]
+    try:
+        buf = BytesIO()
+        tasks = [asyncio.create_task(client.download(url, dest_dir=d)) for d in dest_dirs]
+        # Same destination as the leader, and a normalized variant of the URL into a file object
+        tasks.append(asyncio.create_task(client.download(url, dest_dir=dest_dirs[0])))
+        tasks.append(asyncio.create_task(client.download(url.replace("http://", "HTTP://") + "#top", output=buf)))
+        await asyncio.sleep(0.1)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        broken = str(server.make_url("/broken.bin"))
+        release.clear()
+        failing = [asyncio.create_task(client.download(broken, dest_dir=d)) for d in dest_dirs[:2]]
+        await asyncio.sleep(0.1)
+        release.set()
+        errors = await asyncio.gather(*failing, return_exceptions=True)
+    finally:
+        await server.close()
+        await client.session.close()
+
+    assert hits == ["/asset.bin", "/broken.bin"]
+    for dest_dir, resp in zip(dest_dirs, results, strict=False):
+        assert resp.path == Path(dest_dir).joinpath("asset.bin")
+        assert resp.path.read_bytes() == b"popular asset"
+        assert resp.source == url
+    assert results[5].path == results[0].path
+    assert results[6].content is buf
+    assert buf.getvalue() == b"popular asset"
+    assert all(isinstance(e, aiohttp.ClientResponseError) for e in errors)
+    assert not client._flights
+
+
+@pytest.mark.asyncio
+async def test_filedl_spooled(aioresponses):
+    path = "http://example.com/small.bin"
+    aioresponses.get(path, status=200, body=b"x" * 1024)
+    aioresponses.get(path, status=200, body=b"x" * 1024)
+    client = DownloadClient(config=DownloadConfigSchema(spool_max_size=4096))
+
+    small = await client.download_spooled(path)
+    assert not small.content.rolled
+    view = small.getbuffer()
+    assert view is not None
+    assert view.nbytes == 1024
+    assert bytes(view[:4]) == b"xxxx"
+    # The view is the buffer itself, not a copy
+    view[0] = ord("y")
+    view.release()
+    assert small.content.read(2) == b"yx"
+    small.content.close()
+
+    large = await client.download_spooled(path, max_size=100)
+    assert large.content.rolled
+    assert large.getbuffer() is None
+    assert large.content.read() == b"x" * 1024
+    large.content.close()
+    assert FileInfo(content=BytesIO(b"abc")).getbuffer() == b"abc"
+    await client.session.close()
+
+
+@pytest.mark.asyncio
+async def test_filedl_decode_content(aioboto3_s3_client):
+    payload = b'{"event": "click"}\n' * 100000
+    encoded = zstandard.ZstdCompressor().compress(payload)
+
+    async def handler(_: web.Request) -> web.Response:
+        return web.Response(body=encoded, headers={"Content-Encoding": "zstd"})
+
+    app = web.Application()
+    app.router.add_get("/events.json", handler)
+    server = TestServer(app)
+    await server.start_server()
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = DownloadClient(s3_config=config, config=DownloadConfigSchema(decode_content=True))
+    raw_client = DownloadClient(s3_config=config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.s3.bucket)
+    url = str(server.make_url("/events.json"))
+    try:
+        resp = await client.download(url, dest_dir=mkdtemp())
+        assert Path(resp.path).read_bytes() == payload
+        raw = BytesIO()
+        await raw_client.download(url, output=raw)
+        assert raw.getvalue() == encoded
+
+        # Compressed on the way to S3, digests are of the decoded content
+        info = await client.transfer(url, f"s3://{client.s3.bucket}/events.json.zst", encoding="zstd")
+        assert info.metadata["sha256"] == hashlib.sha256(payload).hexdigest()
+        head = await aioboto3_s3_client.head_object(Bucket=client.s3.bucket, Key="events.json.zst")
+        assert head["ContentEncoding"] == "zstd"
+        assert head["ContentLength"] < len(payload) / 10
+        resp = await client.download(f"s3://{client.s3.bucket}/events.json.zst", dest_dir=mkdtemp())
+        assert Path(resp.path).read_bytes() == payload
+        stored = await client.download_content_addressed(f"s3://{client.s3.bucket}/events.json.zst", mkdtemp())
+        assert stored.metadata["sha256"] == info.metadata["sha256"]
+    finally:
+        await server.close()
+        await client.session.close()
+        await raw_client.session.close()
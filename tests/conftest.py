@@ -1,8 +1,10 @@
 import os
 
 import pytest
+import pytest_asyncio
 
 from ant31box.config import DefaultConfig, config
+from ant31box.s3 import close_clients
 from ant31box.server.server import serve
 
 LOCAL_DIR = os.path.dirname(__file__)
@@ -30,3 +32,10 @@ def reset_config():
 def test_config() -> DefaultConfig:
     """Provides a test-specific configuration object via dependency injection."""
     return config("tests/data/test_config.yaml", reload=True)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def close_s3_clients():
+    """Close the pooled S3 connections opened during a test while its event loop is still running."""
+    yield
+    await close_clients()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+
+import pytest
+
+from ant31box.asyncutils import LoopThread, make_sync, run_sync
+
+
+@make_sync
+async def current_loop() -> tuple[asyncio.AbstractEventLoop, str]:
+    return asyncio.get_running_loop(), threading.current_thread().name
+
+
+@make_sync
+async def fail() -> None:
+    raise KeyError("boom")
+
+
+def test_make_sync_reuses_loop():
+    loop, thread = current_loop()
+    assert thread == "ant31box-loop"
+    assert current_loop()[0] is loop
+    assert run_sync(asyncio.sleep(0, result=42)) == 42
+
+
+def test_make_sync_raises():
+    with pytest.raises(KeyError):
+        fail()
+
+
+@pytest.mark.asyncio
+async def test_make_sync_inside_running_loop():
+    loop, _ = current_loop()
+    assert loop is not asyncio.get_running_loop()
+
+
+def test_loop_thread_stop_callbacks():
+    thread = LoopThread()
+    stopped: list[asyncio.AbstractEventLoop] = []
+
+    async def on_stop() -> None:
+        stopped.append(asyncio.get_running_loop())
+
+    thread.on_stop(on_stop)
+    loop = thread.loop
+    thread.stop()
+    # Run on the loop itself, before it stops
+    assert stopped == [loop]
+    assert not loop.is_running()
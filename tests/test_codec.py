@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+import gzip
+import os
+
+import pytest
+import zstandard
+
+from ant31box.codec import compress_stream, decompress_stream, encoding_of
+
+
+def test_encoding_of():
+    assert encoding_of("gzip") == "gzip"
+    assert encoding_of("X-GZIP") == "gzip"
+    assert encoding_of("br, zstd") == "zstd"
+    assert encoding_of("identity") is None
+    assert encoding_of("br") is None
+    assert encoding_of(None) is None
+
+
+async def _join(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_codec_roundtrip(encoding):
+    payload = b'{"id": 1, "name": "row"}\n' * 50000 + os.urandom(4096)
+    chunks = [payload[i : i + 65536] for i in range(0, len(payload), 65536)]
+    compressed = await _join(compress_stream(chunks, encoding))
+    assert len(compressed) < len(payload) / 10
+    # Decoded the same way as by the reference implementations
+    if encoding == "gzip":
+        assert gzip.decompress(compressed) == payload
+    else:
+        assert zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == payload
+    pieces = [compressed[i : i + 1000] for i in range(0, len(compressed), 1000)]
+    assert await _join(decompress_stream(pieces, encoding)) == payload
+
+    # Concatenated members/frames are all decoded, truncated streams are errors
+    assert await _join(decompress_stream([compressed + compressed], encoding)) == payload + payload
+    with pytest.raises(ValueError, match="Truncated"):
+        await _join(decompress_stream([compressed[:-10]], encoding))
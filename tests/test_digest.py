@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+import hashlib
+
+from ant31box.digest import ContentDigest
+
+
+def test_content_digest_single_part():
+    digest = ContentDigest(algorithms=("sha256", "sha1"), etag_part_size=4, etag_threshold=16)
+    for chunk in (b"hello ", b"world"):
+        digest.update(chunk)
+    assert digest.size == 11
+    assert digest.hexdigest() == hashlib.sha256(b"hello world").hexdigest()
+    assert digest.hexdigests()["sha1"] == hashlib.sha1(b"hello world").hexdigest()
+    assert digest.etag == hashlib.md5(b"hello world").hexdigest()
+
+
+def test_content_digest_multipart_etag():
+    data = b"0123456789"
+    digest = ContentDigest(etag_part_size=4, etag_threshold=4)
+    digest.update(data[:3])
+    digest.update(data[3:])
+    parts = [hashlib.md5(data[i : i + 4]).digest() for i in range(0, len(data), 4)]
+    assert digest.etag == f"{hashlib.md5(b''.join(parts)).hexdigest()}-3"
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkdtemp
+
+import pytest
+
+from ant31box.config import DiskCacheConfigSchema
+from ant31box.diskcache import DiskCache
+
+
+def _put(cache: DiskCache, key: str, content: bytes, **metadata: str):
+    tmp = cache.tempfile()
+    tmp.write_bytes(content)
+    return cache.commit(key, tmp, metadata)
+
+
+def test_diskcache_lookup_and_validate():
+    cache = DiskCache(DiskCacheConfigSchema(path=mkdtemp()))
+    assert cache.lookup("s3://b/k", etag="1") is None
+    entry = _put(cache, "s3://b/k", b"data", etag="1")
+    assert entry.path.read_bytes() == b"data"
+    assert cache.lookup("s3://b/k", etag="1") == entry
+    # A changed validator drops the stale entry
+    assert cache.lookup("s3://b/k", etag="2") is None
+    assert not entry.path.exists()
+    assert cache.stats.model_dump() == {"hits": 1, "misses": 2, "evictions": 0}
+    assert not list(Path(cache.root).glob(".tmp-*"))
+
+
+def test_diskcache_lru_eviction():
+    cache = DiskCache(DiskCacheConfigSchema(path=mkdtemp(), max_bytes=10))
+    _put(cache, "a", b"aaaa")
+    _put(cache, "b", b"bbbb")
+    assert cache.lookup("a") is not None
+    _put(cache, "c", b"cccc")
+    assert cache.size == 8
+    assert cache.stats.evictions == 1
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") is not None
+
+    # The index survives a restart
+    reloaded = DiskCache(cache.config)
+    assert reloaded.size == 8
+    assert reloaded.lookup("c") is not None
+
+
+@pytest.mark.asyncio
+async def test_diskcache_materialize():
+    cache = DiskCache(DiskCacheConfigSchema(path=mkdtemp(), hardlink=True))
+    entry = _put(cache, "a", b"content")
+    dest = Path(mkdtemp()).joinpath("out")
+    await cache.materialize(entry, dest)
+    assert dest.read_bytes() == b"content"
+    assert dest.stat().st_ino == entry.path.stat().st_ino
+    # Materializing again to the same path keeps the link
+    await cache.materialize(entry, dest)
+    assert dest.read_bytes() == b"content"
+    assert dest.stat().st_ino == entry.path.stat().st_ino
+    buffer = BytesIO()
+    await cache.materialize(entry, buffer)
+    assert buffer.getvalue() == b"content"
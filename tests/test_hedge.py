@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import asyncio
+
+import pytest
+
+from ant31box.hedge import MIN_SAMPLES, LatencyWindow, hedged
+
+
+def test_latency_window_deadline():
+    window = LatencyWindow(size=100, percentile=90, initial=0.5, minimum=0.01)
+    assert window.deadline() == 0.5
+    for i in range(1, 101):
+        window.record(i / 1000)
+    assert len(window) == 100
+    assert window.deadline() == pytest.approx(0.09)
+    for _ in range(MIN_SAMPLES * 5):
+        window.record(0.0)
+    assert window.deadline() == 0.01
+
+
+@pytest.mark.asyncio
+async def test_hedged_fast_call_not_duplicated():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "ok"
+
+    assert await hedged(call, 1.0) == "ok"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_slow_call_loses():
+    delays = [10.0, 0.0]
+    hedges = []
+
+    async def call():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert await hedged(call, 0.01, on_hedge=lambda: hedges.append(1)) == 0.0
+    assert hedges == [1]
+
+
+@pytest.mark.asyncio
+async def test_hedged_records_cancelled_latency():
+    window = LatencyWindow(size=100, percentile=95, initial=0.02)
+    delays = [10.0, 0.0]
+
+    async def call():
+        await asyncio.sleep(delays.pop(0))
+
+    await hedged(window.timed(call), window.deadline())
+    # Let the cancelled call unwind
+    await asyncio.sleep(0)
+    # The hedge won, the slow call still counts for at least the time it ran
+    assert len(window) == 2
+    assert max(window._samples) >= 0.02
+
+    # Calls cancelled before the deadline say nothing about the tail
+    task = asyncio.ensure_future(window.timed(lambda: asyncio.sleep(10))())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert len(window) == 2
+
+
+@pytest.mark.asyncio
+async def test_hedged_errors():
+    attempts = iter([ValueError("first"), None])
+
+    async def call():
+        await asyncio.sleep(0.05)
+        error = next(attempts)
+        if error is not None:
+            raise error
+        return "second"
+
+    # The first call fails after the hedge was sent: the second one still wins
+    assert await hedged(call, 0.01) == "second"
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        await hedged(fail, 0.01)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryFile, mkdtemp
+
+import pytest
+
+from ant31box.localcopy import copy_file, copy_to_fileobj
+
+
+@pytest.fixture
+def source() -> Path:
+    path = Path(mkdtemp()).joinpath("source.bin")
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    return path
+
+
+def test_copy_file(source):
+    dest = source.with_name("copy.bin")
+    assert copy_file(source, dest) in {"copy_file_range", "sendfile", "read"}
+    assert dest.read_bytes() == source.read_bytes()
+    assert dest.stat().st_ino != source.stat().st_ino
+
+    # An existing destination is replaced
+    dest.write_bytes(b"x" * 10 * 1024 * 1024)
+    copy_file(source, dest)
+    assert dest.read_bytes() == source.read_bytes()
+
+
+def test_copy_file_links(source):
+    dest = source.with_name("link.bin")
+    dest.write_bytes(b"old")
+    assert copy_file(source, dest, "hardlink") == "hardlink"
+    assert dest.stat().st_ino == source.stat().st_ino
+
+    # Filesystems without reflink support fall back to a copy
+    dest = source.with_name("reflink.bin")
+    assert copy_file(source, dest, "reflink") in {"reflink", "copy_file_range", "sendfile", "read"}
+    assert dest.read_bytes() == source.read_bytes()
+
+
+def test_copy_to_fileobj(source):
+    buf = BytesIO()
+    assert copy_to_fileobj(source, buf, chunk_size=1024 * 1024) == source.stat().st_size
+    assert buf.getvalue() == source.read_bytes()
+
+    empty = source.with_name("empty.bin")
+    empty.touch()
+    assert copy_to_fileobj(empty, BytesIO()) == 0
+
+    # procfs reports a size of 0 for files with content
+    buf = BytesIO()
+    assert copy_to_fileobj("/proc/version", buf, chunk_size=16) == len(buf.getvalue())
+    assert buf.getvalue() == Path("/proc/version").read_bytes()
+
+
+def test_copy_to_fileobj_memory():
+    source = Path(mkdtemp()).joinpath("large.bin")
+    with open(source, "wb") as f:
+        for _ in range(64):
+            f.write(b"x" * 1024 * 1024)
+    with TemporaryFile() as out:
+        tracemalloc.start()
+        try:
+            copy_to_fileobj(source, out, chunk_size=1024 * 1024)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert out.tell() == 64 * 1024 * 1024
+    assert peak < 4 * 1024 * 1024
+
+
+@pytest.mark.parametrize("mode", ["copy", "hardlink", "reflink"])
+def test_copy_file_same_file(source, mode):
+    content = source.read_bytes()
+    with pytest.raises(shutil.SameFileError):
+        copy_file(source, source, mode)
+    assert source.read_bytes() == content
+
+    # A destination already linked to the source is kept as is, or replaced by a copy
+    link = source.with_name("link.bin")
+    os.link(source, link)
+    technique = copy_file(source, link, mode)
+    assert (technique == "hardlink") == (mode == "hardlink")
+    assert source.read_bytes() == content
+    assert link.read_bytes() == content
+    assert (link.stat().st_ino == source.stat().st_ino) == (mode == "hardlink")
+
+
+def test_copy_file_unknown_size():
+    # procfs reports a size of 0 for files with content
+    dest = Path(mkdtemp()).joinpath("version")
+    assert copy_file("/proc/version", dest) == "read"
+    assert dest.stat().st_size > 0
+    assert dest.read_bytes() == Path("/proc/version").read_bytes()
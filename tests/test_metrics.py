@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, values
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from ant31box.config import S3ConfigSchema
+from ant31box.metrics import MULTIPROC_ENV, enable_multiprocess, s3_metrics
+from ant31box.s3 import S3Client
+
+
+def _sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_s3_metrics(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a",
+        access_key="a",
+        region="us-east-1",
+        bucket="metrics-bucket",
+        endpoint=aioboto3_s3_client.meta.endpoint_url,
+        metrics=True,
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    bucket = client.bucket
+    uploads = _sample("ant31box_s3_operation_duration_seconds_count", operation="upload", bucket=bucket)
+    uploaded = _sample("ant31box_s3_transferred_bytes_total", operation="upload", bucket=bucket)
+    downloaded = _sample("ant31box_s3_transferred_bytes_total", operation="download", bucket=bucket)
+
+    dest = await client.upload_file_async(BytesIO(b"metrics"), "metrics/a.txt")
+    await client.download_file_async(dest, BytesIO())
+    assert [obj.key async for obj in client.list_objects("metrics/")] == ["metrics/a.txt"]
+    await client.delete_many(["metrics/a.txt"])
+    with pytest.raises(ClientError):
+        await client.download_file_async(dest, BytesIO())
+
+    assert _sample("ant31box_s3_operation_duration_seconds_count", operation="upload", bucket=bucket) == uploads + 1
+    assert _sample("ant31box_s3_transferred_bytes_total", operation="upload", bucket=bucket) == uploaded + 7
+    assert _sample("ant31box_s3_transferred_bytes_total", operation="download", bucket=bucket) == downloaded + 7
+    assert _sample("ant31box_s3_operation_duration_seconds_count", operation="list", bucket=bucket) >= 1
+    assert _sample("ant31box_s3_operation_duration_seconds_count", operation="delete", bucket=bucket) >= 1
+    assert _sample("ant31box_s3_errors_total", operation="download", bucket=bucket, code="404") >= 1
+
+
+def test_s3_metrics_retries():
+    metrics = s3_metrics()
+    before = _sample("ant31box_s3_retries_total", api="GetObject", bucket="retry-bucket")
+    metrics.on_after_call(
+        parsed={"ResponseMetadata": {"RetryAttempts": 2}},
+        model=SimpleNamespace(name="GetObject"),
+        context={"s3_redirect": {"bucket": "retry-bucket"}},
+    )
+    assert _sample("ant31box_s3_retries_total", api="GetObject", bucket="retry-bucket") == before + 2
+
+
+def test_s3_metrics_disabled():
+    client = S3Client(S3ConfigSchema(secret_key="a", access_key="a"))
+    assert client.metrics is None
+
+
+def test_enable_multiprocess(monkeypatch, tmp_path):
+    # Registered as set so that monkeypatch removes the variable enable_multiprocess exports
+    monkeypatch.setenv(MULTIPROC_ENV, "")
+    monkeypatch.delenv(MULTIPROC_ENV)
+    monkeypatch.delenv(MULTIPROC_ENV.lower(), raising=False)
+    monkeypatch.setattr(values, "ValueClass", values.ValueClass)
+
+    enable_multiprocess(str(tmp_path))
+    assert os.environ[MULTIPROC_ENV] == str(tmp_path)
+    counter = Counter("ant31box_test_multiprocess", "Multiprocess test counter", registry=None)
+    counter.inc(3)
+
+    assert list(tmp_path.glob("counter_*.db"))
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value("ant31box_test_multiprocess_total") == 3
+
+
+def test_enable_multiprocess_env_precedence(monkeypatch, tmp_path):
+    monkeypatch.setenv(MULTIPROC_ENV, str(tmp_path))
+    monkeypatch.setattr(values, "ValueClass", values.ValueClass)
+    value_class = values.ValueClass
+
+    enable_multiprocess(str(tmp_path.joinpath("other")))
+    assert os.environ[MULTIPROC_ENV] == str(tmp_path)
+    assert values.ValueClass is value_class
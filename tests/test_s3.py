@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
+import asyncio
+import hashlib
+import os
+import time
+import tracemalloc
+from io import BytesIO
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
 
+import aiohttp
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from botocore.exceptions import ClientError
+from prometheus_client import REGISTRY
 
-from ant31box.config import S3ConfigSchema
+from ant31box.asyncutils import run_sync
+from ant31box.config import (
+    DiskCacheConfigSchema,
+    S3ConfigSchema,
+    S3HedgeConfigSchema,
+    S3RetryConfigSchema,
+    S3TransferConfigSchema,
+)
 from ant31box.models import S3URL
 from ant31box.s3 import S3Client
 
@@ -136,3 +154,532 @@ async def test_s3_copy_s3_s3(aioboto3_s3_client):
     )
     assert res[0].url == f"s3://{client.bucket}/titi/{Path(tmp.name).name}"
     assert res[1].url == f"s3://{bucket2}/copy/{Path(tmp.name).name}"
+
+
+@pytest.mark.asyncio
+async def test_s3_client_is_reused(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a",
+        access_key="a",
+        region="us-east-1",
+        endpoint=aioboto3_s3_client.meta.endpoint_url,
+        max_pool_connections=4,
+    )
+    async with S3Client(config) as client:
+        await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+        s3 = await client.client()
+        assert s3.meta.config.max_pool_connections == 4
+        with NamedTemporaryFile() as tmp:
+            tmp.write(b"test")
+            tmp.seek(0)
+            await client.upload_file_async(filepath=tmp.name, dest="a.txt")
+            await client.upload_file_async(filepath=tmp.name, dest="b.txt")
+        assert await client.client() is s3
+    assert not client._pooled
+    # A closed client is reopened on demand
+    assert await client.client() is not s3
+    await client.close()
+
+
+def test_s3_transfer_config():
+    client = S3Client(S3ConfigSchema(transfer=S3TransferConfigSchema(multipart_chunksize=16, max_in_flight_bytes=64)))
+    conf = client.transfer_config()
+    assert conf.multipart_chunksize == 16
+    assert conf.max_io_queue_size == 4
+    override = client.transfer_config(S3TransferConfigSchema(max_concurrency=3))
+    assert override.max_request_concurrency == 3
+    assert override.multipart_chunksize == 8 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_s3_upload_multipart_override(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    transfer = S3TransferConfigSchema(
+        multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024, max_concurrency=2
+    )
+    payload = b"a" * (6 * 1024 * 1024)
+    dest = await client.upload_file_async(BytesIO(payload), "multipart.bin", transfer=transfer)
+    head = await aioboto3_s3_client.head_object(Bucket=dest.bucket, Key=dest.key)
+    assert head["ContentLength"] == len(payload)
+    # multipart ETags carry the number of parts
+    assert head["ETag"].strip('"').endswith("-2")
+    output = BytesIO()
+    await client.download_file_async(dest, output, transfer=transfer)
+    assert output.getvalue() == payload
+
+
+@pytest.mark.asyncio
+async def test_s3_upload_download_many(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    done = []
+    items = [(BytesIO(f"data-{i}".encode()), f"many/{i}.txt") for i in range(10)]
+    results = await client.upload_many(items, concurrency=3, progress=done.append)
+    assert len(done) == 10
+    assert [r.result.key for r in results] == [f"many/{i}.txt" for i in range(10)]
+    assert all(r.ok for r in results)
+
+    missing = S3URL(bucket=client.bucket, key="many/missing.txt").to_model()
+    downloads = [(r.result, BytesIO()) for r in results[:3]] + [(missing, BytesIO())]
+    results = await client.download_many(downloads, concurrency=2)
+    assert [r.ok for r in results] == [True, True, True, False]
+    assert results[1].dest.getvalue() == b"data-1"
+    assert results[3].error is not None
+
+
+@pytest.mark.asyncio
+async def test_s3_list_objects(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    keys = {f"list/{shard}/{i}.txt" for shard in "abc" for i in range(5)} | {"list/root.txt", "other/x.txt"}
+    await client.upload_many((BytesIO(b"x"), key) for key in keys)
+
+    listed = [d.key async for d in client.list_objects("list/", page_size=2)]
+    assert listed == sorted(k for k in keys if k.startswith("list/"))
+    assert all(d.url == f"s3://{client.bucket}/{d.key}" for d in [d async for d in client.list_objects("other/")])
+
+    sharded = [d.key async for d in client.list_objects("list/", page_size=2, concurrency=3)]
+    assert sorted(sharded) == listed
+
+    # Stopping early does not leave workers behind
+    async for _ in client.list_objects("list/", page_size=1, concurrency=2):
+        break
+
+
+@pytest.mark.asyncio
+async def test_s3_stream_object(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a",
+        access_key="a",
+        region="us-east-1",
+        endpoint=aioboto3_s3_client.meta.endpoint_url,
+        transfer=S3TransferConfigSchema(multipart_chunksize=1000),
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    payload = bytes(range(256)) * 40
+    dest = await client.upload_file_async(BytesIO(payload), "stream.bin")
+
+    chunks = [c async for c in client.stream_object(dest, chunk_size=4096)]
+    assert b"".join(chunks) == payload
+    assert max(len(c) for c in chunks) <= 4096
+
+    ranged = [c async for c in client.stream_object(dest, 100, offset=10, length=250)]
+    assert b"".join(ranged) == payload[10:260]
+    assert all(len(c) <= 100 for c in ranged)
+
+    parallel = [c async for c in client.stream_object(dest, 300, offset=5, concurrency=4)]
+    assert b"".join(parallel) == payload[5:]
+    assert all(len(c) <= 300 for c in parallel)
+
+    # Empty ranges read nothing, whatever the concurrency
+    assert [c async for c in client.stream_object(dest, offset=10, length=0)] == []
+    assert [c async for c in client.stream_object(dest, offset=10, length=0, concurrency=4)] == []
+    with pytest.raises(ValueError):
+        _ = [c async for c in client.stream_object(dest, length=-1)]
+    with pytest.raises(ValueError):
+        _ = [c async for c in client.stream_object(dest, offset=-1)]
+
+
+@pytest.mark.asyncio
+async def test_s3_delete_many_and_purge(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    await client.upload_many((BytesIO(b"x"), f"tmp/{i}") for i in range(5))
+    await client.upload_many((BytesIO(b"x"), f"purge/{i // 10}/{i}") for i in range(25))
+
+    res = await client.delete_many(f"tmp/{i}" for i in range(3))
+    assert res.ok
+    assert res.deleted == 3
+    assert [d.key async for d in client.list_objects("tmp/")] == ["tmp/3", "tmp/4"]
+
+    res = await client.purge_prefix("purge/", concurrency=2)
+    assert res.deleted == 25
+    assert [d async for d in client.list_objects("purge/")] == []
+
+    with pytest.raises(ValueError):
+        await client.purge_prefix("")
+
+    res = await client.delete_many(["tmp/3"], bucket="missing-bucket")
+    assert not res.ok
+    assert "tmp/3" in res.errors
+
+    # The listing of a missing bucket fails with its own error
+    with pytest.raises(ClientError):
+        await client.purge_prefix("x/", bucket="missing-bucket")
+
+
+@pytest.mark.asyncio
+async def test_s3_copy_multipart_and_prefix(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a",
+        access_key="a",
+        region="us-east-1",
+        endpoint=aioboto3_s3_client.meta.endpoint_url,
+        transfer=S3TransferConfigSchema(
+            multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024, max_concurrency=2
+        ),
+    )
+    client = S3Client(config)
+    bucket2 = "bucketcopy"
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    await aioboto3_s3_client.create_bucket(Bucket=bucket2)
+
+    payload = b"b" * (11 * 1024 * 1024)
+    await aioboto3_s3_client.put_object(
+        Bucket=client.bucket, Key="big/data.bin", Body=payload, ContentType="application/x-test", Metadata={"a": "1"}
+    )
+    _, dest = await client.copy_s3_to_s3_async(
+        src_bucket=client.bucket, src_path="big/data.bin", dest_bucket=bucket2, dest_prefix="copy/"
+    )
+    head = await aioboto3_s3_client.head_object(Bucket=bucket2, Key=dest.key)
+    assert head["ContentLength"] == len(payload)
+    assert head["ETag"].strip('"').endswith("-3")
+    assert head["ContentType"] == "application/x-test"
+    assert head["Metadata"] == {"a": "1"}
+
+    await client.upload_many((BytesIO(b"x"), f"tree/{d}/{i}.txt") for d in "ab" for i in range(3))
+    results = await client.copy_prefix_async(
+        src_bucket=client.bucket, src_prefix="tree/", dest_bucket=bucket2, dest_prefix="mirror/", concurrency=4
+    )
+    assert all(r.ok for r in results)
+    copied = [d.key async for d in client.list_objects("mirror/", bucket2)]
+    assert copied == sorted(f"mirror/tree/{d}/{i}.txt" for d in "ab" for i in range(3))
+
+    results = await client.copy_prefix_async(
+        src_bucket=client.bucket, src_prefix="tree/a/", dest_bucket=bucket2, dest_prefix="flat/", name_only=True
+    )
+    assert sorted(r.result[1].key for r in results) == ["flat/0.txt", "flat/1.txt", "flat/2.txt"]
+
+    with pytest.raises(ClientError):
+        await client.copy_prefix_async(src_bucket="missing-bucket", src_prefix="tree/", dest_bucket=bucket2)
+
+
+@pytest.mark.asyncio
+async def test_s3_download_cache(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a",
+        access_key="a",
+        region="us-east-1",
+        endpoint=aioboto3_s3_client.meta.endpoint_url,
+        cache=DiskCacheConfigSchema(enabled=True, path=mkdtemp()),
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    dest = await client.upload_file_async(BytesIO(b"v1"), "cached.txt")
+    with NamedTemporaryFile() as output:
+        await client.download_file_async(dest, output.name)
+        await client.download_file_async(dest, output.name)
+        assert Path(output.name).read_bytes() == b"v1"
+    assert client.cache.stats.hits == 1
+    assert client.cache.stats.misses == 1
+
+    await client.upload_file_async(BytesIO(b"v2"), "cached.txt")
+    buffer = BytesIO()
+    await client.download_file_async(dest, buffer)
+    assert buffer.getvalue() == b"v2"
+    assert client.cache.stats.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_s3_presign(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    dest = S3URL(bucket=client.bucket, key="presigned/file.txt").to_model()
+
+    put = await client.presign(dest, "PUT", expires_in=60)
+    assert put.dest.url == dest.url
+    assert put.method == "PUT"
+    get = await client.presign(dest)
+    assert get.url != put.url
+    assert await client.presign(dest) is get
+    assert await client.presign(dest, expires_in=10) is not get
+
+    async with aiohttp.ClientSession() as session:
+        async with session.put(put.url, data=b"hello") as resp:
+            assert resp.status == 200
+        async with session.get(get.url) as resp:
+            assert await resp.read() == b"hello"
+
+
+def test_s3_presign_cache_disabled():
+    client = S3Client(S3ConfigSchema(secret_key="a", access_key="a", presign_cache_size=0))
+    assert client._presigned is None
+
+
+def test_s3_sync_methods_reuse_client(moto_services):
+    config = S3ConfigSchema(secret_key="a", access_key="a", region="us-east-1", endpoint=moto_services["s3"])
+    client = S3Client(config)
+    client.sync_client.create_bucket(Bucket=client.bucket)
+    with pytest.warns(DeprecationWarning):
+        dest = client.upload_file(BytesIO(b"sync"), "sync.txt")
+    ((s3, _),) = client._pooled.values()
+    output = BytesIO()
+    with pytest.warns(DeprecationWarning):
+        client.download_file(dest, output)
+    assert output.getvalue() == b"sync"
+    assert list(client._pooled.values())[0][0] is s3
+    run_sync(client.close())
+    assert not client._pooled
+
+
+@pytest.mark.asyncio
+async def test_s3_client_per_loop(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    dest = await client.upload_file_async(BytesIO(b"loops"), "loops.txt")
+    s3 = await client.client()
+    # The sync facades run on the background loop, with a client of their own
+    with pytest.warns(DeprecationWarning):
+        client.download_file(dest, BytesIO())
+    background = run_sync(client.client())
+    assert background is not s3
+    assert len(client._pooled) == 2
+    # Switching between loops reuses the client of each loop
+    assert await client.client() is s3
+    assert run_sync(client.client()) is background
+
+    # Closing from one loop closes the clients of every loop, each on its own loop
+    await client.close()
+    assert not client._pooled
+    assert run_sync(client.client()) is not background
+    await client.close()
+    assert not client._pooled
+
+
+@pytest.mark.asyncio
+async def test_s3_upload_skip_unchanged(aioboto3_s3_client, caplog):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+
+    # Objects uploaded elsewhere are matched on their ETag
+    await aioboto3_s3_client.put_object(Bucket=client.bucket, Key="dedupe/a.txt", Body=b"same")
+    before = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key="dedupe/a.txt")
+    dest = await client.upload_file_async(BytesIO(b"same"), "dedupe/a.txt", skip_unchanged=True)
+    after = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key="dedupe/a.txt")
+    assert dest.key == "dedupe/a.txt"
+    assert after["LastModified"] == before["LastModified"]
+    assert "sha256" not in after["Metadata"]
+
+    source = BytesIO(b"changed")
+    await client.upload_file_async(source, "dedupe/a.txt", skip_unchanged=True)
+    head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key="dedupe/a.txt")
+    assert head["Metadata"]["sha256"] == hashlib.sha256(b"changed").hexdigest()
+    assert head["ContentLength"] == len(b"changed")
+
+    transfer = S3TransferConfigSchema(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+    payload = b"m" * (6 * 1024 * 1024)
+    await aioboto3_s3_client.put_object(Bucket=client.bucket, Key="dedupe/big.bin", Body=b"old")
+    with NamedTemporaryFile() as tmp:
+        tmp.write(payload)
+        tmp.flush()
+        await client.upload_file_async(tmp.name, "dedupe/big.bin", transfer=transfer, skip_unchanged=True)
+        head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key="dedupe/big.bin")
+        assert head["ContentLength"] == len(payload)
+        caplog.clear()
+        with caplog.at_level("INFO", logger="ant31box.s3"):
+            await client.upload_file_async(tmp.name, "dedupe/big.bin", transfer=transfer, skip_unchanged=True)
+        assert "upload skipped" in caplog.text
+
+
+@pytest.fixture
+async def s3_proxy(aioboto3_s3_client):
+    """Fake S3 endpoint forwarding to moto, that can delay GETs or answer SlowDown."""
+    upstream = aioboto3_s3_client.meta.endpoint_url
+    faults = {"slow": 0, "throttle": 0, "gets": 0}
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        data = await request.read()
+        if request.method == "GET" and "/hedge/" in request.path:
+            faults["gets"] += 1
+            if faults["slow"]:
+                faults["slow"] -= 1
+                await asyncio.sleep(5)
+        if faults["throttle"]:
+            faults["throttle"] -= 1
+            body = b"<Error><Code>SlowDown</Code><Message>Reduce your request rate.</Message></Error>"
+            return web.Response(status=503, body=body, content_type="application/xml")
+        async with (
+            aiohttp.ClientSession() as session,
+            session.request(
+                request.method,
+                f"{upstream}{request.path_qs}",
+                headers={k: v for k, v in request.headers.items() if k.lower() != "host"},
+                data=data,
+            ) as resp,
+        ):
+            headers = {k: v for k, v in resp.headers.items() if k.lower() not in {"content-length", "server", "date"}}
+            return web.Response(status=resp.status, headers=headers, body=await resp.read())
+
+    server = TestServer(_proxy_app(handler))
+    await server.start_server()
+    yield str(server.make_url("")).rstrip("/"), faults
+    await server.close()
+
+
+def _proxy_app(handler) -> web.Application:
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}", handler)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_s3_hedged_get(aioboto3_s3_client, s3_proxy):
+    endpoint, faults = s3_proxy
+    hedge = S3HedgeConfigSchema(enabled=True, initial_delay=0.2)
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=endpoint, hedge=hedge, metrics=True
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    await aioboto3_s3_client.put_object(Bucket=client.bucket, Key="hedge/a.txt", Body=b"hedged")
+    dest = client.s3url("hedge/a.txt").to_model()
+    hedges = REGISTRY.get_sample_value("ant31box_s3_hedged_requests_total", {"bucket": client.bucket}) or 0
+
+    # The first GET stalls for 5s: the hedged request answers instead
+    faults["slow"] = 1
+    start = time.perf_counter()
+    assert b"".join([chunk async for chunk in client.stream_object(dest)]) == b"hedged"
+    assert time.perf_counter() - start < 2
+    assert faults["gets"] == 2
+    assert REGISTRY.get_sample_value("ant31box_s3_hedged_requests_total", {"bucket": client.bucket}) == hedges + 1
+
+    faults["slow"] = 1
+    single = S3TransferConfigSchema(max_concurrency=1)
+    buf = BytesIO()
+    await client.download_file_async(dest, buf, transfer=single)
+    assert buf.getvalue() == b"hedged"
+    assert faults["gets"] == 4
+
+    # Fast responses are not duplicated
+    buf = BytesIO()
+    await client.download_file_async(dest, buf, transfer=single)
+    assert buf.getvalue() == b"hedged"
+    assert faults["gets"] == 5
+
+
+@pytest.mark.asyncio
+async def test_s3_adaptive_retry_slowdown(aioboto3_s3_client, s3_proxy):
+    endpoint, faults = s3_proxy
+    retry = S3RetryConfigSchema(mode="adaptive", max_attempts=5)
+    config = S3ConfigSchema(secret_key="a", access_key="a", region="us-east-1", endpoint=endpoint, retry=retry)
+    client = S3Client(config)
+    s3 = await client.client()
+    assert s3.meta.config.retries == {"mode": "adaptive", "total_max_attempts": 5}
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+
+    faults["throttle"] = 2
+    dest = await client.upload_file_async(BytesIO(b"throttled"), "retry/a.txt")
+    faults["throttle"] = 2
+    assert b"".join([chunk async for chunk in client.stream_object(dest)]) == b"throttled"
+    assert faults["throttle"] == 0
+
+
+@pytest.mark.asyncio
+async def test_s3_upload_stream(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    part = 5 * 1024 * 1024
+    transfer = S3TransferConfigSchema(multipart_chunksize=part, max_concurrency=2)
+
+    async def generate(count: int, fail: bool = False):
+        for i in range(count):
+            yield bytes([i % 256]) * (1024 * 1024)
+        if fail:
+            raise RuntimeError("source failed")
+
+    # Small streams use a single PutObject
+    dest = await client.upload_stream_async(generate(1), "stream/small.bin", transfer)
+    head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key=dest.key)
+    assert head["ContentLength"] == 1024 * 1024
+    assert "-" not in head["ETag"]
+
+    tracemalloc.start()
+    try:
+        dest = await client.upload_stream_async(
+            generate(32), "stream/big.bin", transfer, extra_args={"ContentType": "application/x-test"}
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Parts in flight plus the one being filled, far below the 32 MiB object
+    assert peak < 6 * part
+    head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key=dest.key)
+    assert head["ContentLength"] == 32 * 1024 * 1024
+    assert head["ETag"].endswith('-7"')
+    assert head["ContentType"] == "application/x-test"
+    data = b"".join([chunk async for chunk in client.stream_object(dest)])
+    assert data == b"".join(bytes([i % 256]) * (1024 * 1024) for i in range(32))
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        await client.upload_stream_async(generate(12, fail=True), "stream/failed.bin", transfer)
+    uploads = await aioboto3_s3_client.list_multipart_uploads(Bucket=client.bucket)
+    assert not uploads.get("Uploads")
+
+
+@pytest.mark.asyncio
+async def test_s3_content_encoding(aioboto3_s3_client):
+    config = S3ConfigSchema(
+        secret_key="a", access_key="a", region="us-east-1", endpoint=aioboto3_s3_client.meta.endpoint_url
+    )
+    client = S3Client(config)
+    await aioboto3_s3_client.create_bucket(Bucket=client.bucket)
+    payload = b"date,value\n" + b"2025-01-01,42\n" * 200000
+    transfer = S3TransferConfigSchema(multipart_chunksize=5 * 1024 * 1024, max_concurrency=2)
+
+    with NamedTemporaryFile(suffix=".csv") as tmp:
+        tmp.write(payload)
+        tmp.flush()
+        dest = await client.upload_file_async(tmp.name, "encoded/data.csv", transfer, encoding="zstd")
+        with pytest.raises(ValueError, match="skip_unchanged"):
+            await client.upload_file_async(tmp.name, "encoded/x.csv", skip_unchanged=True, encoding="gzip")
+    head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key=dest.key)
+    assert head["ContentEncoding"] == "zstd"
+    assert head["ContentLength"] < len(payload) / 10
+
+    # Raw bytes unless decoding is asked for
+    raw = b"".join([chunk async for chunk in client.stream_object(dest)])
+    assert len(raw) == head["ContentLength"]
+    chunks = [chunk async for chunk in client.stream_object(dest, 64 * 1024, decode=True)]
+    assert b"".join(chunks) == payload
+    assert max(len(chunk) for chunk in chunks) == 64 * 1024
+    with pytest.raises(ValueError, match="range"):
+        await anext(client.stream_object(dest, offset=10, decode=True))
+
+    # A multipart gzip stream, decoded while downloading
+    noise = os.urandom(6 * 1024 * 1024)
+    big = await client.upload_stream_async([payload, noise], "encoded/big.csv", transfer, encoding="gzip")
+    head = await aioboto3_s3_client.head_object(Bucket=client.bucket, Key=big.key)
+    assert head["ContentEncoding"] == "gzip"
+    assert head["ETag"].endswith('-2"')
+    out = Path(mkdtemp()).joinpath("big.csv")
+    await client.download_file_async(big, out, transfer, decode=True)
+    assert out.read_bytes() == payload + noise
+    buf = BytesIO()
+    await client.download_file_async(dest, buf, decode=True)
+    assert buf.getvalue() == payload
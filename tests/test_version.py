@@ -1,4 +1,3 @@
-
 from ant31box.version import VERSION, Version
 
 